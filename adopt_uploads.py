@@ -0,0 +1,23 @@
+import sys
+from data import db_session
+from data.blobs import adopt_files, collect_garbage
+
+# Разовый перенос загрузок из uploads/ в хранилище по содержимому (data/blobs.py): одинаковые файлы
+# сливаются в один, у материалов появляются content_hash и имя для скачивания. Повторный запуск ничего не делает
+
+
+def main():
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'db/university.db'
+    root = sys.argv[2] if len(sys.argv) > 2 else 'uploads'
+    db_session.global_init(db_file, checkpoint_interval=0)
+    s = db_session.create_session()
+    adopted, missing = adopt_files(s, root)
+    print(f'✅ Перенесено в хранилище: {adopted}')
+    if missing:
+        print(f"⚠️ Файлы не найдены для материалов: {', '.join(map(str, missing))}")
+    print(f'🗑 Удалено файлов без ссылок: {len(collect_garbage(s, root))}')
+    s.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,14 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, abort
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, abort, g, has_request_context
+from sqlalchemy import event as sa_event, func
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from werkzeug.utils import send_file as offload_file
+from urllib.parse import quote
 from collections import OrderedDict
+import hashlib
 import os
-from datetime import datetime
+import secrets
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 import unicodedata
 
@@ -9,14 +16,27 @@ import unicodedata
 
 app = Flask(__name__)
 app.secret_key = 'hackathon_secret_key_2025'
+# Отдачу файлов материалов можно передать фронт-прокси: 'sendfile' — заголовок X-Sendfile (Apache, lighttpd),
+# 'accel' — X-Accel-Redirect для nginx (internal location с alias на папку загрузок под DOWNLOAD_ACCEL_PREFIX).
+# Права проверяет приложение, байты, диапазоны и повторные запросы обслуживает прокси. USE_X_SENDFILE не включается:
+# он глобальный, и /static тоже уходил бы прокси пустым ответом
+DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '')
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
 
 # ==================== ПУТИ И ПАПКИ ====================
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'db', 'university.db')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+GROUPS_FILE = os.path.join(BASE_DIR, 'groups.json')
 
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'doc', 'ppt'}
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 200 * 1024 * 1024))  # байт на файл
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))  # байт на часть при загрузке частями
+UPLOAD_SESSION_TTL = timedelta(days=1)  # незавершённые загрузки старше удаляются
+# Загрузка формой: тело больше лимита отклоняется с 413 до разбора (запас — на поля формы)
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_SIZE + 1024 * 1024
+SAFE_CHARS = set('абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯabcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.()')
 
 # Создаём папки если их нет
 os.makedirs(os.path.join(BASE_DIR, 'db'), exist_ok=True)
@@ -27,50 +47,310 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 from data import db_session
 from data.users import User
-from data.schedule import Schedule
+from data.schedule import DAY_NAMES, Lesson, Schedule, lesson_rows, semester_start, teacher_rows, week_of
 from data.notes import Note
-from data.materials import Material
-
-db_session.global_init(DB_PATH)
+from data.materials import Material, material_page
+from data.blobs import collect_garbage, material_file, store_file, store_upload
+from data.upload_sessions import UploadSession, part_path, write_chunk
+from data.week_fingerprints import WeekFingerprint
+from data.lookups import StudyGroup, Teacher
+from data.rooms import free_rooms, room_conflicts
+from data.search import fts_query, search_material_ids, search_schedule
+from schedule_cache import ScheduleCache
+from ical import calendar_chunks
+from zipstream import zip_chunks
+import refresh_scheduler
+import text_index
+
+# Отдельные движки для записи и чтения; WAL — чтобы страницы открывались, пока парсер пишет
+db_session.global_init(DB_PATH, journal_mode=os.environ.get('DB_JOURNAL_MODE', 'WAL'), read_pool_size=int(os.environ.get('DB_READ_POOL', 8)),
+                       checkpoint_interval=int(os.environ.get('DB_CHECKPOINT_INTERVAL', 300)))
+
+# Фоновое обновление расписания включается переменной окружения и только в одном процессе
+if os.environ.get('REFRESH_SCHEDULER') == '1':
+    refresh_scheduler.start(GROUPS_FILE)
+    print("✅ Планировщик обновления расписания запущен")
+
+# Текст загруженных файлов для поиска извлекается в пуле процессов; здесь — то, что не успели до перезапуска
+text_index.start(UPLOAD_FOLDER)
+
+schedule_cache = ScheduleCache(maxsize=int(os.environ.get('SCHEDULE_CACHE_SIZE', 256)))
+feed_cache = ScheduleCache(maxsize=int(os.environ.get('FEED_CACHE_SIZE', 512)))
+semester_memo = {}
+groups_memo = {}
+WEEKS = 18
+MAX_RANGE_DAYS = 62  # наибольший период для /api/schedule/<группа>/range
+MATERIALS_PAGE = 20  # материалов на странице; дальше — подгрузка из /api/materials при прокрутке
 
 print(f"✅ База данных инициализирована: {DB_PATH}")
 print(f"✅ Папка загрузок: {UPLOAD_FOLDER}")
 
+# ==================== СЕССИЯ БД НА ЗАПРОС ====================
+# Одна сессия на запрос: создаётся при первом обращении, закрывается в teardown даже при
+# исключении или abort(). Если в запросе уже открыта сессия на запись, чтение идёт через неё
+
+def get_db(write=False):
+    if 'db' in g:
+        return g.db
+    if write:
+        g.db = db_session.create_session()
+        return g.db
+    if 'db_read' not in g:
+        g.db_read = db_session.create_read_session()
+    return g.db_read
+
+
+@app.teardown_appcontext
+def close_db(exc):
+    for key in ('db', 'db_read'):
+        s = g.pop(key, None)
+        if s is not None:
+            if exc is not None:
+                s.rollback()
+            s.close()
+
+
+def count_checkout(dbapi_connection, connection_record, connection_proxy):
+    if has_request_context():
+        g.db_checkouts = g.get('db_checkouts', 0) + 1
+
+
+for engine in db_session.engines():
+    sa_event.listen(engine, 'checkout', count_checkout)
+
+
+@app.after_request
+def report_checkouts(response):
+    # В режиме отладки показываем, сколько раз запрос брал соединение из пула
+    if app.debug:
+        response.headers['X-DB-Checkouts'] = str(g.get('db_checkouts', 0))
+        app.logger.debug('%s %s: соединений из пула %d', request.method, request.path, g.get('db_checkouts', 0))
+    return response
+
 # ==================== ФУНКЦИИ ====================
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def upload_name(original_filename, title):
+    # Имя файла при скачивании: безопасные символы исходного имени, пробелы — подчёркивания; если ничего не осталось — из названия
+    def clean(text):
+        return ''.join('_' if char == ' ' else char for char in text if char in SAFE_CHARS or char == ' ')
+    filename = clean(original_filename)
+    if not filename or filename == '.pdf':
+        filename = clean(title) + os.path.splitext(original_filename)[1]
+    return filename
+
+def add_materials(s, group_names, stored, file_name, **fields):
+    # По строке на группу; stored — (content_hash, file_path) из хранилища, автор и роль — из сессии
+    content_hash, file_path = stored
+    s.add_all([Material(group_name=group_name.strip(), file_path=file_path, file_name=file_name, content_hash=content_hash, teacher_name=session.get('username'),
+                        upload_date=datetime.now(), uploaded_by_role=session.get('role'), **fields) for group_name in group_names])
+
+def delete_material_row(s, material):
+    # Строка удаляется сразу, файл — только когда на него не ссылается ни один материал
+    content_hash, file_path = material.content_hash, material.file_path
+    s.delete(material)
+    s.commit()
+    if content_hash:
+        collect_garbage(s, UPLOAD_FOLDER)
+    elif not s.query(Material.id).filter(Material.file_path == file_path).first():
+        # Файл, загруженный до хранилища по содержимому
+        path = material_file(UPLOAD_FOLDER, file_path)
+        if os.path.exists(path):
+            os.remove(path)
+
 def get_schedule_from_db(group_name):
-    s = db_session.create_session()
+    s = get_db()
+    e = s.query(Schedule).filter(Schedule.group_name == group_name).order_by(Schedule.week_number, Schedule.lesson_number).all()
+    if not e:
+        return {}
+    d = {'группа': group_name, 'group_id': e[0].group_id if e else None, 'последнее_обновление': e[0].last_updated.strftime('%Y-%m-%d %H:%M:%S') if e else None, 'недели': OrderedDict()}
+    weeks = {}
+    for entry in e:
+        week_num = str(entry.week_number)
+        if week_num not in weeks:
+            weeks[week_num] = {}
+        day_name = entry.day_name
+        if day_name not in weeks[week_num]:
+            weeks[week_num][day_name] = {'дата': entry.date, 'пары': []}
+        weeks[week_num][day_name]['пары'].append({'номер_пары': entry.lesson_number, 'время': entry.time_slot, 'предмет': entry.subject, 'тип': entry.lesson_type, 'преподаватель': entry.teacher, 'аудитория': entry.classroom})
+    for week_num in sorted(weeks.keys(), key=int):
+        d['недели'][week_num] = weeks[week_num]
+    return d
+
+
+def get_cached_schedule(group_name):
+    # (данные, JSON, ETag) расписания группы; пересобирается, только если парсер изменил группу
+    version = get_db().query(StudyGroup.version).filter(StudyGroup.name == group_name).scalar()
+    cached = schedule_cache.get(group_name, version)
+    if cached:
+        return cached
+    d = get_schedule_from_db(group_name)
+    return schedule_cache.put(group_name, version, d, app.json.dumps(d) + '\n')
+
+
+def group_id_subquery(group_name):
+    # id группы подзапросом: поиск по имени и выборка пар уходят в БД одним запросом
+    return get_db().query(StudyGroup.id).filter(StudyGroup.name == group_name).scalar_subquery()
+
+
+def get_groups_state():
+    # Справочник групп из study_groups в памяти процесса. Перед использованием сверяется отметка
+    # (сумма версий, последнее обновление, число групп) — один запрос к маленькой таблице, раз за запрос
+    if 'groups_state' in g:
+        return g.groups_state
+    stamp = tuple(get_db().query(func.total(StudyGroup.version), func.max(StudyGroup.refreshed_at), func.count(StudyGroup.id)).one())
+    if groups_memo.get('stamp') != stamp:
+        rows = (get_db().query(StudyGroup.id, StudyGroup.name, StudyGroup.lesson_count, StudyGroup.week_count, StudyGroup.first_week, StudyGroup.last_week, StudyGroup.refreshed_at)
+                .filter(StudyGroup.lesson_count > 0).order_by(StudyGroup.name).all())
+        directory = [{'id': group_id, 'name': name, 'lessons': lessons, 'weeks': weeks, 'first_week': first_week, 'last_week': last_week,
+                      'refreshed_at': refreshed_at.strftime('%Y-%m-%d %H:%M:%S') if refreshed_at else None}
+                     for group_id, name, lessons, weeks, first_week, last_week, refreshed_at in rows]
+        groups_memo.update(stamp=stamp, key=stamp[0], names=[group['name'] for group in directory], directory=directory)
+    g.groups_state = groups_memo.copy()
+    return g.groups_state
+
+
+def get_semester_start():
+    # Начало семестра считается по всем lessons, поэтому пересчитывается, только когда парсер что-то изменил
+    key = get_groups_state()['key']
+    if semester_memo.get('key') != key:
+        semester_memo.update(key=key, start=semester_start(get_db()))
+    return semester_memo['start']
+
+
+def get_current_week():
+    start = get_semester_start()
+    if start is None:
+        return None
+    return max(1, min(WEEKS, (datetime.now().date() - start).days // 7 + 1))
+
+
+def lesson_days(rows):
+    # {(неделя, номер дня): {'дата', 'пары'}} — тот же формат дня, что в get_schedule_from_db
+    days = {}
+    for week, day, day_date, number, time_slot, subject, lesson_type, teacher, classroom in rows:
+        entry = days.setdefault((week, day), {'дата': day_date.strftime('%d.%m.%Y') if day_date else '', 'пары': []})
+        entry['пары'].append({'номер_пары': number, 'время': time_slot, 'предмет': subject, 'тип': lesson_type, 'преподаватель': teacher, 'аудитория': classroom})
+    return days
+
+
+def day_schedule(start, days, day):
+    return {'дата': day.strftime('%d.%m.%Y'), 'день': DAY_NAMES[day.weekday()] if day.weekday() < len(DAY_NAMES) else 'Воскресенье',
+            'неделя': week_of(start, day, WEEKS), 'пары': days.get(day, {'пары': []})['пары']}
+
+
+def get_days_schedule(group_name, date_from, date_to):
+    # Пары группы за период одним запросом по индексу (group_id, date); дни без пар тоже попадают в ответ
+    rows = lesson_rows(get_db(), group_id_subquery(group_name), date_from=date_from, date_to=date_to)
+    by_date = {datetime.strptime(entry['дата'], '%d.%m.%Y').date(): entry for entry in lesson_days(rows).values() if entry['дата']}
+    start = get_semester_start()
+    return [day_schedule(start, by_date, date_from + timedelta(days=i)) for i in range((date_to - date_from).days + 1)]
+
+
+def parse_date(value):
     try:
-        e = s.query(Schedule).filter(Schedule.group_name == group_name).order_by(Schedule.week_number, Schedule.lesson_number).all()
-        if not e:
-            return {}
-        d = {'группа': group_name, 'group_id': e[0].group_id if e else None, 'последнее_обновление': e[0].last_updated.strftime('%Y-%m-%d %H:%M:%S') if e else None, 'недели': OrderedDict()}
-        weeks = {}
-        for entry in e:
-            week_num = str(entry.week_number)
-            if week_num not in weeks:
-                weeks[week_num] = {}
-            day_name = entry.day_name
-            if day_name not in weeks[week_num]:
-                weeks[week_num][day_name] = {'дата': entry.date, 'пары': []}
-            weeks[week_num][day_name]['пары'].append({'номер_пары': entry.lesson_number, 'время': entry.time_slot, 'предмет': entry.subject, 'тип': entry.lesson_type, 'преподаватель': entry.teacher, 'аудитория': entry.classroom})
-        for week_num in sorted(weeks.keys(), key=int):
-            d['недели'][week_num] = weeks[week_num]
-        return d
-    finally:
-        s.close()
+        return datetime.strptime(value or '', '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def get_week_schedule(group_name, week_number):
+    rows = lesson_rows(get_db(), group_id_subquery(group_name), weeks=[week_number])
+    return {DAY_NAMES[day - 1]: entry for (_, day), entry in lesson_days(rows).items()}
+
+
+def get_notes(user_id, group_name):
+    notes = get_db().query(Note.week_number, Note.day_name, Note.note_text).filter(Note.user_id == user_id, Note.group_name == group_name).all()
+    return {f"{week_number}_{day_name}": note_text for week_number, day_name, note_text in notes}
+
+
+def schedule_bootstrap(group_name, week_number):
+    # Всё, что нужно странице расписания для первого показа: видимая неделя и заметки пользователя
+    return {'группа': group_name, 'неделя': week_number, 'расписание': get_week_schedule(group_name, week_number) if group_name else {},
+            'заметки': get_notes(session.get('user_id'), group_name) if group_name else {}}
+
+
+def get_teacher_weeks(teacher_name, weeks=None):
+    # {неделя: {день: {'дата', 'пары'}}}; поток, который ведётся сразу у нескольких групп, — одна пара со списком групп
+    teacher_id = get_db().query(Teacher.id).filter(Teacher.name == teacher_name).scalar_subquery()
+    result = OrderedDict()
+    merged = {}
+    for week, day, day_date, number, time_slot, subject, lesson_type, classroom, group_name in teacher_rows(get_db(), teacher_id, weeks):
+        key = (week, day, number, subject, lesson_type, classroom)
+        if key in merged:
+            if group_name not in merged[key]['группы']:
+                merged[key]['группы'].append(group_name)
+                merged[key]['группы'].sort()
+            continue
+        entry = result.setdefault(str(week), OrderedDict()).setdefault(DAY_NAMES[day - 1], {'дата': day_date.strftime('%d.%m.%Y') if day_date else '', 'пары': []})
+        merged[key] = {'номер_пары': number, 'время': time_slot, 'предмет': subject, 'тип': lesson_type, 'аудитория': classroom, 'группы': [group_name]}
+        entry['пары'].append(merged[key])
+    return result
+
+
+def get_feed_state(group_filter):
+    # [(group_id, версия, последнее изменение)] групп, из которых собирается лента
+    changed = get_db().query(func.max(WeekFingerprint.changed_at)).filter(WeekFingerprint.group_id == StudyGroup.id).scalar_subquery()
+    return get_db().query(StudyGroup.id, StudyGroup.version, changed).filter(group_filter).order_by(StudyGroup.id).all()
+
+
+def serve_feed(kind, name, group_filter, build_days):
+    # Лента .ics: ключ кэша и ETag — версии групп, поэтому неизменившийся опрос отвечает 304 без чтения пар,
+    # а при промахе лента отдаётся потоком и попутно складывается в кэш
+    state = get_feed_state(group_filter)
+    if not state:
+        abort(404)
+    version = tuple((group_id, group_version) for group_id, group_version, _ in state)
+    last_modified = max((changed for *_, changed in state if changed), default=None)
+    if last_modified:
+        last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)  # в БД — местное время
+    etag = hashlib.sha1(f'{kind}:{name}:{version}'.encode('utf-8')).hexdigest()
+    response = app.response_class(mimetype='text/calendar')
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Content-Disposition'] = f'inline; filename="{kind}.ics"'
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        return response
+    cached = feed_cache.get((kind, name), version)
+    if cached:
+        response.set_data(cached[1])
+        return response
+    days = build_days()
+    uid_prefix = kind[0] + hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]
+
+    def generate():
+        chunks = []
+        for chunk in calendar_chunks(name, uid_prefix, days, last_modified):
+            chunks.append(chunk)
+            yield chunk
+        feed_cache.put((kind, name), version, last_modified, b''.join(chunks), etag)
+    response.response = generate()
+    return response
+
+
+def find_materials(q, **filters):
+    # Материалы по поисковому запросу в порядке релевантности
+    ids = search_material_ids(get_db(), q, **filters)
+    found = {material.id: material for material in get_db().query(Material).filter(Material.id.in_(ids)).all()} if ids else {}
+    return [found[material_id] for material_id in ids if material_id in found]
+
+
+def material_json(m):
+    return {'id': m.id, 'название': m.title, 'предмет': m.subject, 'описание': m.description, 'тип': m.file_type, 'группа': m.group_name,
+            'преподаватель': m.teacher_name, 'роль': m.uploaded_by_role, 'дата': m.upload_date.strftime('%d.%m.%Y') if m.upload_date else None}
+
+
+def get_all_teachers():
+    return [name for name, in get_db().query(Teacher.name).order_by(Teacher.name).all()]
 
 
 def get_all_groups():
-    s = db_session.create_session()
-    try:
-        groups = s.query(Schedule.group_name).distinct().all()
-        return [group[0] for group in groups]
-    finally:
-        s.close()
+    return list(get_groups_state()['names'])
 
 
 def login_required_custom(f):
@@ -98,7 +378,7 @@ def login():
     if request.method == 'POST':
         username = request.form.get('login')
         password = request.form.get('password')
-        s = db_session.create_session()
+        s = get_db()
         user = s.query(User).filter(User.username == username).first()
         if user and user.check_password(password):
             session['user_id'] = user.id
@@ -106,12 +386,9 @@ def login():
             session['role'] = user.role
             if user.is_student():
                 session['group'] = user.group_name
-                s.close()
                 return redirect(url_for('student_dashboard'))
             else:
-                s.close()
                 return redirect(url_for('teacher_dashboard'))
-        s.close()
         return render_template('login.html', error='Неверный логин или пароль')
     return render_template('login.html')
 
@@ -124,10 +401,9 @@ def register():
         full_name = request.form.get('full_name')
         role = request.form.get('role')
         group_name = request.form.get('group_name') if role == 'student' else None
-        s = db_session.create_session()
+        s = get_db(write=True)
         existing_user = s.query(User).filter(User.username == username).first()
         if existing_user:
-            s.close()
             return render_template('register.html', error='Пользователь с таким логином уже существует', groups=get_all_groups())
         new_user = User(username=username, full_name=full_name, role=role, group_name=group_name)
         new_user.set_password(password)
@@ -138,7 +414,6 @@ def register():
         session['role'] = new_user.role
         if new_user.is_student():
             session['group'] = new_user.group_name
-        s.close()
         if role == 'student':
             return redirect(url_for('student_dashboard'))
         else:
@@ -169,14 +444,14 @@ def student_materials():
     if session.get('role') != 'student':
         return redirect(url_for('index'))
     current_group = session.get('group')
-    s = db_session.create_session()
-    materials = s.query(Material).filter(Material.group_name == current_group).order_by(Material.upload_date.desc()).all()
-    subjects = s.query(Material.subject).filter(Material.group_name == current_group).distinct().all()
-    subjects = [s[0] for s in subjects]
-    s.close()
+    q = request.args.get('q', '').strip()
+    # Первая страница и число материалов по предметам — одним запросом; остальное страница подгружает сама
+    materials, next_cursor, subjects = material_page(get_db(), MATERIALS_PAGE, group_name=current_group)
+    if q:
+        materials, next_cursor = find_materials(q, group_name=current_group), None
     success = request.args.get('success')
     error = request.args.get('error')
-    return render_template('student_materials.html', materials=materials, subjects=subjects, success=success, error=error)
+    return render_template('student_materials.html', materials=materials, subjects=subjects, next_cursor=next_cursor, success=success, error=error, q=q)
 
 
 @app.route('/student/upload_material_page')
@@ -184,13 +459,10 @@ def student_materials():
 def student_upload_material_page():
     if session.get('role') != 'student':
         return redirect(url_for('index'))
-    s = db_session.create_session()
-    student_name = session.get('username')
-    materials = s.query(Material).filter(Material.teacher_name == student_name, Material.uploaded_by_role == 'student').order_by(Material.upload_date.desc()).all()
-    s.close()
+    materials, next_cursor, _ = material_page(get_db(), MATERIALS_PAGE, teacher_name=session.get('username'), uploaded_by_role='student')
     success = request.args.get('success')
     error = request.args.get('error')
-    return render_template('student_upload_material.html', materials=materials, success=success, error=error)
+    return render_template('student_upload_material.html', materials=materials, next_cursor=next_cursor, success=success, error=error)
 
 
 @app.route('/student/delete_material/<int:material_id>', methods=['POST'])
@@ -198,24 +470,17 @@ def student_upload_material_page():
 def student_delete_material(material_id):
     if session.get('role') != 'student':
         return redirect(url_for('index'))
-    s = db_session.create_session()
+    s = get_db(write=True)
     material = s.query(Material).filter(Material.id == material_id).first()
     if not material:
-        s.close()
         return redirect(url_for('student_upload_material_page') + '?error=Материал не найден')
     if material.teacher_name != session.get('username') or material.uploaded_by_role != 'student':
-        s.close()
         return redirect(url_for('student_upload_material_page') + '?error=Вы не можете удалить этот материал')
     try:
-        if os.path.exists(material.file_path):
-            os.remove(material.file_path)
-        s.delete(material)
-        s.commit()
+        delete_material_row(s, material)
     except Exception as e:
         s.rollback()
-        s.close()
         return redirect(url_for('student_upload_material_page') + f'?error=Ошибка удаления: {str(e)}')
-    s.close()
     return redirect(url_for('student_upload_material_page') + '?success=Материал успешно удалён')
 
 
@@ -237,40 +502,13 @@ def student_upload_material():
         file_type = request.form.get('file_type')
         description = request.form.get('description', '')
         group_name = session.get('group')
-        student_name = session.get('username')
         if not all([title, subject, file_type]):
             return redirect(url_for('student_upload_material_page') + '?error=Заполните все обязательные поля')
-        original_filename = file.filename
-        safe_chars = "абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯabcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.()"
-        filename = ""
-        for char in original_filename:
-            if char in safe_chars:
-                filename += char
-            elif char == " ":
-                filename += "_"
-        if not filename or filename == '.pdf':
-            name_from_title = ""
-            for char in title:
-                if char in safe_chars:
-                    name_from_title += char
-                elif char == " ":
-                    name_from_title += "_"
-            ext = os.path.splitext(original_filename)[1]
-            filename = name_from_title + ext
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        counter = 1
-        name, ext = os.path.splitext(filename)
-        while os.path.exists(file_path):
-            filename = f"{name}_{counter}{ext}"
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            counter += 1
-        file.save(file_path)
-        s = db_session.create_session()
-        material = Material(group_name=group_name, subject=subject, title=title, description=description, file_path=file_path, file_type=file_type, teacher_name=student_name, upload_date=datetime.now(), uploaded_by_role='student')
-        s.add(material)
+        s = get_db(write=True)
+        stored = store_upload(s, file.stream, UPLOAD_FOLDER)
+        add_materials(s, [group_name], stored, upload_name(file.filename, title), subject=subject, title=title, description=description, file_type=file_type)
         s.commit()
-        s.close()
+        text_index.submit(stored[0])
         return redirect(url_for('student_materials') + '?success=Материал успешно загружен!')
     except Exception as e:
         import traceback
@@ -283,9 +521,8 @@ def student_upload_material():
 def student_profile():
     if session.get('role') != 'student':
         return redirect(url_for('teacher_profile'))
-    s = db_session.create_session()
+    s = get_db()
     user = s.query(User).get(session['user_id'])
-    s.close()
     return render_template('profile.html', user=user)
 
 
@@ -298,10 +535,9 @@ def schedule():
         current_group = session.get('group', groups_list[0] if groups_list else None)
     else:
         current_group = request.args.get('group', groups_list[0] if groups_list else None)
-    d = {}
-    if current_group:
-        d = get_schedule_from_db(current_group)
-    return render_template('schedule.html', schedule=d, groups=groups_list, current_group=current_group)
+    current_week = get_current_week() or 1
+    return render_template('schedule.html', groups=groups_list, current_group=current_group, current_week=current_week,
+                           bootstrap=schedule_bootstrap(current_group, current_week))
 
 
 @app.route('/student/schedule')
@@ -312,7 +548,12 @@ def student_schedule():
 @app.route('/teacher/schedule')
 @login_required_custom
 def teacher_schedule():
-    return redirect(url_for('schedule'))
+    # Расписание преподавателя по всем группам; семестр целиком приходит в странице одним запросом по индексу
+    teachers = get_all_teachers()
+    current_teacher = request.args.get('teacher') or (session.get('username') if session.get('username') in teachers else (teachers[0] if teachers else None))
+    weeks = get_teacher_weeks(current_teacher) if current_teacher else {}
+    return render_template('teacher_schedule.html', teachers=teachers, current_teacher=current_teacher, current_week=get_current_week() or 1,
+                           bootstrap={'преподаватель': current_teacher, 'недели': weeks})
 
 
 
@@ -334,14 +575,16 @@ def student_dashboard():
 def teacher_materials():
     if session.get('role') != 'teacher':
         return redirect(url_for('index'))
-    s = db_session.create_session()
     teacher_name = session.get('username')
-    materials = s.query(Material).filter(Material.teacher_name == teacher_name).order_by(Material.upload_date.desc()).all()
+    q = request.args.get('q', '').strip()
+    if q:
+        materials, next_cursor = find_materials(q, teacher_name=teacher_name), None
+    else:
+        materials, next_cursor, _ = material_page(get_db(), MATERIALS_PAGE, teacher_name=teacher_name)
     groups = get_all_groups()
-    s.close()
     success = request.args.get('success')
     error = request.args.get('error')
-    return render_template('teacher_materials.html', materials=materials, groups=groups, success=success, error=error)
+    return render_template('teacher_materials.html', materials=materials, groups=groups, next_cursor=next_cursor, success=success, error=error, q=q)
 
 
 @app.route('/teacher/upload_material', methods=['POST'])
@@ -364,56 +607,18 @@ def upload_material():
         subject = request.form.get('subject')
         file_type = request.form.get('file_type')
         description = request.form.get('description', '')
-        teacher_name = session.get('username')
 
         if not all([title, group_names, subject, file_type]):
             return redirect(url_for('teacher_materials') + '?error=Заполните все обязательные поля')
 
-        # Сохраняем файл один раз
-        original_filename = file.filename
-        safe_chars = "абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯabcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_."
-        filename = ""
-        for char in original_filename:
-            if char in safe_chars:
-                filename += char
-            elif char == " ":
-                filename += "_"
-        if not filename or filename == '.pdf':
-            name_from_title = ""
-            for char in title:
-                if char in safe_chars:
-                    name_from_title += char
-                elif char == " ":
-                    name_from_title += "_"
-            ext = os.path.splitext(original_filename)[1]
-            filename = name_from_title + ext
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        counter = 1
-        name, ext = os.path.splitext(filename)
-        while os.path.exists(file_path):
-            filename = f"{name}_{counter}{ext}"
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            counter += 1
-        file.save(file_path)
+        # Файл сохраняется один раз, в хранилище по содержимому; строки всех групп ссылаются на него
+        s = get_db(write=True)
+        stored = store_upload(s, file.stream, UPLOAD_FOLDER)
 
         # Создаем запись в БД для каждой выбранной группы
-        s = db_session.create_session()
-        for group_name in group_names:
-            material = Material(
-                group_name=group_name.strip(),
-                subject=subject,
-                title=title,
-                description=description,
-                file_path=file_path,
-                file_type=file_type,
-                teacher_name=teacher_name,
-                upload_date=datetime.now(),
-                uploaded_by_role='teacher'
-            )
-            s.add(material)
+        add_materials(s, group_names, stored, upload_name(file.filename, title), subject=subject, title=title, description=description, file_type=file_type)
         s.commit()
-        s.close()
+        text_index.submit(stored[0])
 
         groups_count = len(group_names)
         return redirect(url_for('teacher_materials') + f'?success=Материал успешно загружен для {groups_count} групп(ы)!')
@@ -429,14 +634,10 @@ def delete_material(material_id):
     if session.get('role') != 'teacher':
         return redirect(url_for('index'))
     try:
-        s = db_session.create_session()
+        s = get_db(write=True)
         material = s.query(Material).filter(Material.id == material_id).first()
         if material:
-            if os.path.exists(material.file_path):
-                os.remove(material.file_path)
-            s.delete(material)
-            s.commit()
-        s.close()
+            delete_material_row(s, material)
         return redirect(url_for('teacher_materials') + '?success=Материал удалён')
     except Exception as e:
         return redirect(url_for('teacher_materials') + f'?error=Ошибка удаления: {str(e)}')
@@ -447,28 +648,155 @@ def delete_material(material_id):
 def teacher_profile():
     if session.get('role') != 'teacher':
         return redirect(url_for('student_profile'))
-    s = db_session.create_session()
+    s = get_db()
     user = s.query(User).get(session['user_id'])
-    s.close()
     return render_template('profile.html', user=user)
 
 
 
 @app.route('/api/schedule/<group_name>')
 def api_schedule(group_name):
-    d = get_schedule_from_db(group_name)
-    return jsonify(d)
+    d, payload, etag = get_cached_schedule(group_name)
+    response = app.response_class(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/ics/group/<group_name>.ics')
+def ics_group(group_name):
+    def days():
+        rows = lesson_rows(get_db(), group_id_subquery(group_name))
+        return [(entry['дата'], entry['пары']) for entry in lesson_days(rows).values()]
+    return serve_feed('group', group_name, StudyGroup.name == group_name, days)
+
+@app.route('/ics/teacher/<teacher_name>.ics')
+def ics_teacher(teacher_name):
+    teacher_id = get_db().query(Teacher.id).filter(Teacher.name == teacher_name).scalar_subquery()
+    groups = get_db().query(Lesson.group_id).filter(Lesson.teacher_id == teacher_id)
+
+    def days():
+        return [(day['дата'], day['пары']) for week in get_teacher_weeks(teacher_name).values() for day in week.values()]
+    return serve_feed('teacher', teacher_name, StudyGroup.id.in_(groups), days)
 
 @app.route('/api/schedule/<group_name>/week/<int:week_number>')
 def api_week(group_name, week_number):
-    d = get_schedule_from_db(group_name)
-    week_data = d.get('недели', {}).get(str(week_number), {})
-    return jsonify({'группа': group_name, 'неделя': week_number, 'расписание': week_data})
+    return jsonify({'группа': group_name, 'неделя': week_number, 'расписание': get_week_schedule(group_name, week_number)})
+
+@app.route('/api/schedule/<group_name>/bootstrap')
+@login_required_custom
+def api_bootstrap(group_name):
+    # Смена группы на странице расписания: неделя и заметки одним запросом
+    return jsonify(schedule_bootstrap(group_name, request.args.get('week', get_current_week() or 1, type=int)))
+
+@app.route('/api/schedule/<group_name>/current')
+def api_current(group_name):
+    return api_week(group_name, get_current_week() or 1)
+
+@app.route('/api/schedule/<group_name>/today')
+def api_today(group_name):
+    today = datetime.now().date()
+    return jsonify({'группа': group_name, **get_days_schedule(group_name, today, today)[0]})
+
+@app.route('/api/schedule/<group_name>/day/<day>')
+def api_day(group_name, day):
+    day = parse_date(day)
+    if day is None:
+        return jsonify({'error': 'Дата должна быть в формате ГГГГ-ММ-ДД'}), 400
+    return jsonify({'группа': group_name, **get_days_schedule(group_name, day, day)[0]})
+
+@app.route('/api/schedule/<group_name>/range')
+def api_range(group_name):
+    date_from, date_to = parse_date(request.args.get('from')), parse_date(request.args.get('to'))
+    if date_from is None or date_to is None:
+        return jsonify({'error': 'Параметры from и to должны быть датами в формате ГГГГ-ММ-ДД'}), 400
+    if date_to < date_from or (date_to - date_from).days >= MAX_RANGE_DAYS:
+        return jsonify({'error': f'Период должен быть не длиннее {MAX_RANGE_DAYS} дней'}), 400
+    return jsonify({'группа': group_name, 'с': date_from.strftime('%d.%m.%Y'), 'по': date_to.strftime('%d.%m.%Y'), 'дни': get_days_schedule(group_name, date_from, date_to)})
+
+@app.route('/api/teacher/<teacher_name>')
+def api_teacher(teacher_name):
+    return jsonify({'преподаватель': teacher_name, 'недели': get_teacher_weeks(teacher_name)})
+
+@app.route('/api/teacher/<teacher_name>/week/<int:week_number>')
+def api_teacher_week(teacher_name, week_number):
+    weeks = get_teacher_weeks(teacher_name, [week_number])
+    return jsonify({'преподаватель': teacher_name, 'неделя': week_number, 'расписание': weeks.get(str(week_number), {})})
+
+@app.route('/api/rooms/free')
+def api_free_rooms():
+    # ?date=ГГГГ-ММ-ДД или ?week=&day= (1 — понедельник), slot=3 или slot=3,4; building — номер корпуса
+    day = parse_date(request.args.get('date'))
+    week, weekday = request.args.get('week', type=int), request.args.get('day', type=int)
+    if day is None and week and weekday and get_semester_start():
+        day = get_semester_start() + timedelta(weeks=week - 1, days=weekday - 1)
+    try:
+        slots = [int(slot) for slot in request.args.get('slot', '').split(',') if slot.strip()]
+    except ValueError:
+        slots = []
+    if day is None or not slots or any(not 1 <= slot <= 9 for slot in slots):
+        return jsonify({'error': 'Нужны date (ГГГГ-ММ-ДД) или week и day, а также slot от 1 до 9'}), 400
+    building = request.args.get('building')
+    rooms = free_rooms(get_db(), day, slots, building)
+    return jsonify({'дата': day.strftime('%d.%m.%Y'), 'пары': slots, 'корпус': building, 'свободные': rooms})
+
+@app.route('/api/rooms/conflicts')
+def api_room_conflicts():
+    date_from, date_to = parse_date(request.args.get('from')), parse_date(request.args.get('to'))
+    if date_from is None or date_to is None or date_to < date_from:
+        return jsonify({'error': 'Параметры from и to должны быть датами в формате ГГГГ-ММ-ДД'}), 400
+    conflicts = room_conflicts(get_db(), date_from, date_to)
+    return jsonify({'конфликты': [{'дата': day.strftime('%d.%m.%Y'), 'аудитория': name, 'пары': slots} for day, name, slots in conflicts]})
+
+@app.route('/api/search')
+@login_required_custom
+def api_search():
+    # ?q=...&scope=all|schedule|materials&group=...; студент ищет материалы только своей группы
+    q = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'all')
+    limit = max(1, min(100, request.args.get('limit', 20, type=int)))
+    if not fts_query(q):
+        return jsonify({'error': 'Пустой поисковый запрос'}), 400
+    group_name = session.get('group') if session.get('role') == 'student' else request.args.get('group')
+    result = {'запрос': q}
+    if scope in ('all', 'schedule'):
+        result['расписание'] = search_schedule(get_db(), q, limit, request.args.get('group'))
+    if scope in ('all', 'materials'):
+        result['материалы'] = [material_json(m) for m in find_materials(q, limit=limit, group_name=group_name)]
+    return jsonify(result)
+
+@app.route('/api/materials')
+@login_required_custom
+def api_materials():
+    # ?after=<курсор>&limit=&subject=&type=&uploader=teacher|student&mine=1&group=; студент видит только свою группу.
+    # На первой странице — ещё и число материалов по предметам
+    filters = {'subject': request.args.get('subject') or None, 'file_type': request.args.get('type') or None,
+               'uploaded_by_role': request.args.get('uploader') or None,
+               'group_name': session.get('group') if session.get('role') == 'student' else request.args.get('group') or None}
+    if request.args.get('mine'):
+        filters['teacher_name'] = session.get('username')
+    limit = max(1, min(100, request.args.get('limit', MATERIALS_PAGE, type=int)))
+    try:
+        rows, next_cursor, counts = material_page(get_db(), limit, request.args.get('after'), **filters)
+    except ValueError:
+        return jsonify({'error': 'Неверный курсор страницы'}), 400
+    result = {'материалы': [material_json(m) for m in rows], 'следующая': next_cursor}
+    if counts is not None:
+        result['предметы'] = counts
+    return jsonify(result)
+
+@app.route('/api/current_week')
+def api_current_week():
+    start = get_semester_start()
+    return jsonify({'неделя': get_current_week(), 'начало_семестра': start.strftime('%d.%m.%Y') if start else None})
 
 @app.route('/api/groups')
 def api_groups():
-    groups = get_all_groups()
-    return jsonify(groups)
+    # Справочник групп: id, название, число пар, покрытие недель и время последнего обновления
+    return jsonify(get_groups_state()['directory'])
+
+@app.route('/api/refresh/status')
+def api_refresh_status():
+    return jsonify(refresh_scheduler.status(GROUPS_FILE))
 
 
 
@@ -483,7 +811,7 @@ def save_note():
     note_text = data.get('note_text', '').strip()[:64]
     if not note_text:
         return jsonify({'success': False, 'error': 'Заметка пустая'})
-    s = db_session.create_session()
+    s = get_db(write=True)
     note = s.query(Note).filter(Note.user_id == user_id, Note.group_name == group_name, Note.week_number == week_number, Note.day_name == day_name).first()
     if note:
         note.note_text = note_text
@@ -492,7 +820,6 @@ def save_note():
         note = Note(user_id=user_id, group_name=group_name, week_number=week_number, day_name=day_name, note_text=note_text)
         s.add(note)
     s.commit()
-    s.close()
     return jsonify({'success': True, 'note': note_text})
 
 
@@ -504,12 +831,11 @@ def delete_note():
     group_name = data.get('group_name')
     week_number = data.get('week_number')
     day_name = data.get('day_name')
-    s = db_session.create_session()
+    s = get_db(write=True)
     note = s.query(Note).filter(Note.user_id == user_id, Note.group_name == group_name, Note.week_number == week_number, Note.day_name == day_name).first()
     if note:
         s.delete(note)
         s.commit()
-    s.close()
     return jsonify({'success': True})
 
 
@@ -519,21 +845,115 @@ def get_all_notes():
     data = request.get_json()
     user_id = session.get('user_id')
     group_name = data.get('group_name')
-    s = db_session.create_session()
-    notes = s.query(Note).filter(Note.user_id == user_id, Note.group_name == group_name).all()
-    notes_dict = {}
-    for note in notes:
-        key = f"{note.week_number}_{note.day_name}"
-        notes_dict[key] = note.note_text
-    s.close()
-    return jsonify({'success': True, 'notes': notes_dict})
+    return jsonify({'success': True, 'notes': get_notes(user_id, group_name)})
+
+
+
+# ==================== ЗАГРУЗКА ЧАСТЯМИ ====================
+# POST /api/uploads {filename, size} → сессия; PUT .../chunks/<n> — часть n (тело запроса как есть);
+# GET /api/uploads/<id> — сколько принято, с какой части продолжать; POST .../complete — поля формы → материал
+
+def get_upload(upload_id):
+    upload = get_db(write=True).get(UploadSession, upload_id)
+    if upload is None or upload.user_id != session.get('user_id'):
+        abort(404)
+    return upload
+
+def drop_upload(s, upload):
+    path = part_path(UPLOAD_FOLDER, upload.id)
+    if os.path.exists(path):
+        os.remove(path)
+    s.delete(upload)
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required_custom
+def api_upload_start():
+    data = request.get_json(silent=True) or {}
+    filename, size = data.get('filename') or '', data.get('size')
+    if not allowed_file(filename):
+        return jsonify({'error': 'Недопустимый формат файла'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'Нужен размер файла в байтах'}), 400
+    if size > UPLOAD_MAX_SIZE:
+        return jsonify({'error': f'Файл больше {UPLOAD_MAX_SIZE // (1024 * 1024)} МБ'}), 413
+    s = get_db(write=True)
+    # Заодно убираем брошенные загрузки
+    for stale in s.query(UploadSession).filter(UploadSession.updated_at < datetime.now() - UPLOAD_SESSION_TTL).all():
+        drop_upload(s, stale)
+    upload = UploadSession(id=secrets.token_hex(16), user_id=session.get('user_id'), filename=filename, size=size, chunk_size=UPLOAD_CHUNK_SIZE,
+                           received=0, created_at=datetime.now(), updated_at=datetime.now())
+    os.makedirs(os.path.dirname(part_path(UPLOAD_FOLDER, upload.id)), exist_ok=True)
+    open(part_path(UPLOAD_FOLDER, upload.id), 'wb').close()
+    s.add(upload)
+    s.commit()
+    return jsonify(upload.state()), 201
 
+@app.route('/api/uploads/<upload_id>')
+@login_required_custom
+def api_upload_state(upload_id):
+    return jsonify(get_upload(upload_id).state())
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required_custom
+def api_upload_chunk(upload_id, index):
+    upload = get_upload(upload_id)
+    offset = index * upload.chunk_size
+    length = min(upload.chunk_size, upload.size - offset)
+    if offset < upload.received:
+        # Часть уже принята (ответ на неё потерялся при обрыве)
+        return jsonify(upload.state())
+    if offset > upload.received or length <= 0:
+        return jsonify({'error': f'Ожидается часть {upload.received // upload.chunk_size}', **upload.state()}), 409
+    # Лимит проверяется до чтения тела и ещё раз при записи: больше length байт не читается
+    if request.content_length != length:
+        return jsonify({'error': f'Часть {index} должна быть ровно {length} байт'}), 413 if (request.content_length or 0) > length else 400
+    if write_chunk(part_path(UPLOAD_FOLDER, upload.id), offset, request.stream, length) < length:
+        return jsonify({'error': 'Часть получена не полностью', **upload.state()}), 400
+    s = get_db(write=True)
+    # Условие по received — защита от одновременной записи той же части из двух вкладок
+    s.query(UploadSession).filter(UploadSession.id == upload.id, UploadSession.received == offset).update(
+        {'received': offset + length, 'updated_at': datetime.now()}, synchronize_session=False)
+    s.commit()
+    s.refresh(upload)
+    return jsonify(upload.state())
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required_custom
+def api_upload_cancel(upload_id):
+    s = get_db(write=True)
+    drop_upload(s, get_upload(upload_id))
+    s.commit()
+    return jsonify({'success': True})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required_custom
+def api_upload_complete(upload_id):
+    upload = get_upload(upload_id)
+    if upload.received != upload.size:
+        return jsonify({'error': 'Файл загружен не полностью', **upload.state()}), 409
+    form = request.get_json(silent=True) or request.form
+    title, subject, file_type, description = form.get('title'), form.get('subject'), form.get('file_type'), form.get('description', '')
+    if session.get('role') == 'teacher':
+        group_names = [name for name in (form.get('group_names') or '').split(',') if name.strip()]
+        done = url_for('teacher_materials') + f'?success=Материал успешно загружен для {len(group_names)} групп(ы)!'
+    else:
+        group_names = [session.get('group')]
+        done = url_for('student_materials') + '?success=Материал успешно загружен!'
+    if not all([title, group_names, subject, file_type]):
+        return jsonify({'error': 'Заполните все обязательные поля'}), 400
+    s = get_db(write=True)
+    stored = store_file(s, part_path(UPLOAD_FOLDER, upload.id), UPLOAD_FOLDER)
+    add_materials(s, group_names, stored, upload_name(upload.filename, title), subject=subject, title=title, description=description, file_type=file_type)
+    s.delete(upload)
+    s.commit()
+    text_index.submit(stored[0])
+    return jsonify({'success': True, 'redirect': done})
 
 
 @app.route('/download/material/<int:material_id>')
 @login_required_custom
 def download_material(material_id):
-    s = db_session.create_session()
+    s = get_db()
     try:
         material = s.query(Material).filter(Material.id == material_id).first()
         if not material:
@@ -543,23 +963,86 @@ def download_material(material_id):
                 abort(403)
 
         # Проверяем существует ли файл
-        if not os.path.exists(material.file_path):
-            print(f"Файл не найден: {material.file_path}")
+        path = material_file(UPLOAD_FOLDER, material.file_path)
+        if not os.path.exists(path):
+            print(f"Файл не найден: {path}")
             abort(404)
 
         # Получаем имя файла для скачивания
-        download_name = os.path.basename(material.file_path)
-
-        return send_file(material.file_path, as_attachment=True, download_name=download_name)
+        download_name = material.file_name or os.path.basename(material.file_path)
+
+        # Файл в хранилище не меняется, его sha256 — сильный ETag; у старых файлов ETag из mtime и размера.
+        # Flask сам отвечает 304 и 206 на Range / If-Range; при выдаче через прокси диапазоны обслуживает прокси
+        if DOWNLOAD_OFFLOAD:
+            # Ответ с пустым телом и X-Sendfile — только для материалов; заголовки (размер, тип, имя) те же, что у send_file
+            response = offload_file(path, request.environ, as_attachment=True, download_name=download_name, etag=material.content_hash or True,
+                                    conditional=False, use_x_sendfile=True, response_class=app.response_class)
+        else:
+            response = send_file(path, as_attachment=True, download_name=download_name, etag=material.content_hash or True)
+        response.cache_control.private = True
+        if DOWNLOAD_OFFLOAD:
+            if DOWNLOAD_OFFLOAD == 'accel':
+                response.headers.pop('X-Sendfile', None)
+                response.headers['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX + quote(os.path.relpath(path, UPLOAD_FOLDER).replace(os.sep, '/'))
+            response = response.make_conditional(request)
+            if response.status_code == 304:
+                response.headers.pop('X-Sendfile', None)
+                response.headers.pop('X-Accel-Redirect', None)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Ошибка при скачивании: {str(e)}")
         import traceback
         traceback.print_exc()
         abort(404)
-    finally:
-        s.close()
 
 
+@app.route('/download/materials.zip')
+@login_required_custom
+def download_materials_zip():
+    # Архив материалов по предмету, группе или списку ids=1,2,3. Студенту — только его группа, преподавателю нужен хотя бы один фильтр.
+    # Список файлов собирается до ответа, сам архив пишется генератором: первые байты уходят сразу, в памяти — один кусок
+    subject = request.args.get('subject', '').strip()
+    group_name = request.args.get('group', '').strip()
+    ids = [int(part) for part in request.args.get('ids', '').split(',') if part.strip().isdigit()]
+    if session.get('role') == 'student':
+        group_name = session.get('group')
+    elif not (subject or group_name or ids):
+        abort(400)
+    query = get_db().query(Material)
+    if subject:
+        query = query.filter(Material.subject == subject)
+    if group_name:
+        query = query.filter(Material.group_name == group_name)
+    if ids:
+        query = query.filter(Material.id.in_(ids))
+    entries, seen, names = [], set(), set()
+    for material in query.order_by(Material.subject, Material.upload_date, Material.id).all():
+        # Один файл, разосланный нескольким группам, кладётся в папку предмета один раз; в другом предмете он — отдельный материал
+        folder = upload_name(material.subject or '', '') or 'Без_предмета'
+        key = (folder, material.content_hash or material.file_path)
+        path = material_file(UPLOAD_FOLDER, material.file_path)
+        if key in seen or not os.path.isfile(path):
+            continue
+        seen.add(key)
+        stem, ext = os.path.splitext(material.file_name or os.path.basename(material.file_path))
+        name, n = f'{folder}/{stem}{ext}', 1
+        while name in names:
+            n += 1
+            name = f'{folder}/{stem}_({n}){ext}'
+        names.add(name)
+        entries.append((name, path, material.upload_date or datetime.now()))
+    if not entries:
+        abort(404)
+    archive = upload_name(subject or group_name or 'Материалы', '') or 'materials'
+    response = app.response_class(zip_chunks(entries), mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Disposition'] = f"attachment; filename=\"materials.zip\"; filename*=UTF-8''{quote(archive)}.zip"
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx не копит ответ целиком
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
 
 @app.errorhandler(404)
 def page_not_found(e):
@@ -0,0 +1,45 @@
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser import ScheduleParser
+
+# Микробенчмарк разбора ячейки: быстрый путь cell_text против BeautifulSoup на каждую ячейку.
+# Перед замером проверяет, что на корпусе ячеек результат parse_lesson_content совпадает.
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lesson_cells.txt')
+
+
+class SoupOnlyParser(ScheduleParser):
+    def cell_text(self, content):
+        return BeautifulSoup(f'<div>{content}</div>', 'html.parser').get_text(separator='|', strip=True)
+
+
+def main():
+    with open(CORPUS, encoding='utf-8') as f:
+        cells = [line.rstrip('\n') for line in f if line.strip('\n')]
+    fast, soup = ScheduleParser(), SoupOnlyParser()
+    mismatches = [cell for cell in cells if fast.parse_lesson_content(cell) != soup.parse_lesson_content(cell)]
+    for cell in mismatches:
+        print(f'❌ {cell}\n   быстрый:  {fast.parse_lesson_content(cell)}\n   эталон:   {soup.parse_lesson_content(cell)}')
+    print(f'совпадений: {len(cells) - len(mismatches)}/{len(cells)}')
+    if mismatches:
+        sys.exit(1)
+
+    number = 20
+    t_soup = min(timeit.repeat(lambda: [soup.parse_lesson_content(c) for c in cells], number=number, repeat=5))
+    t_fast = min(timeit.repeat(lambda: [fast.parse_lesson_content(c) for c in cells], number=number, repeat=5))
+    per_cell = lambda t: t / (number * len(cells)) * 1e6
+    print(f'BeautifulSoup:  {per_cell(t_soup):7.1f} мкс/ячейка')
+    print(f'быстрый путь:   {per_cell(t_fast):7.1f} мкс/ячейка')
+    print(f'ускорение: {t_soup / t_fast:.1f}×')
+    fast.close()
+    soup.close()
+
+
+if __name__ == '__main__':
+    main()
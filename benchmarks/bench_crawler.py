@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.isu_stub import serve
+from data import db_session
+from parser import ScheduleParser, summarize_report
+
+# Сравнение последовательного обхода (как раньше: requests.post без сессии)
+# с параллельным обходом через общую сессию на локальной заглушке ИСУ и с разбором из архива
+
+
+def run(label, parser, groups, weeks, replay=False):
+    started = time.perf_counter()
+    report = parser.replay(groups, 1, weeks) if replay else parser.crawl(groups, 1, weeks)
+    elapsed = time.perf_counter() - started
+    ok = sum(g['ok'] for g in summarize_report(report).values())
+    print(f'{label:<32} {elapsed:7.2f} с  {len(report) / elapsed:7.1f} нед/с  успешно {ok}/{len(report)}')
+    if isinstance(parser.http, requests.Session):
+        parser.close()
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--groups', type=int, default=10)
+    ap.add_argument('--weeks', type=int, default=18)
+    ap.add_argument('--latency', type=float, default=0.03, help='задержка ответа заглушки, с')
+    ap.add_argument('--workers', type=int, default=8)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db_session.global_init(os.path.join(tmp, 'bench.db'))
+    server, url = serve(latency=args.latency)
+    groups = [{'id': 20000 + i, 'name': f'БЕНЧ-{i}'} for i in range(args.groups)]
+    print(f'{args.groups} групп × {args.weeks} недель, задержка {args.latency * 1000:.0f} мс')
+
+    baseline = ScheduleParser(workers=1, base_url=url)
+    baseline.close()
+    baseline.http = requests  # без Session: новое соединение на каждый запрос
+    t0 = run('последовательно, без keep-alive', baseline, groups, args.weeks)
+    t1 = run('последовательно, общая сессия', ScheduleParser(workers=1, base_url=url), groups, args.weeks)
+    archive = os.path.join(tmp, 'archive')
+    t2 = run(f'параллельно, {args.workers} потоков', ScheduleParser(workers=args.workers, base_url=url, archive_dir=archive), groups, args.weeks)
+    print(f'ускорение: {t0 / t1:.1f}× (сессия), {t0 / t2:.1f}× (сессия + потоки)')
+    run('повтор из архива, без сети', ScheduleParser(archive_dir=archive, force=True), groups, args.weeks, replay=True)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
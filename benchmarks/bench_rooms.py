@@ -0,0 +1,109 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.isu_stub import SEMESTER_START, render_week
+from data import db_session
+from data.lookups import Room
+from data.schedule import Lesson
+import data.rooms as rooms
+import parser as parser_module
+
+# Занятость аудиторий на синтетическом расписании всех групп: цена пересчёта при записи парсера,
+# поиск свободных аудиторий и конфликтов по таблице room_occupancy против прохода по lessons
+
+NAIVE_BUSY = 'SELECT DISTINCT room_id FROM lessons WHERE date = :date AND lesson_number IN ({slots})'
+NAIVE_CONFLICTS = '''SELECT date, room_id, lesson_number FROM lessons WHERE room_id IS NOT NULL AND date BETWEEN :date_from AND :date_to
+GROUP BY date, room_id, lesson_number HAVING COUNT(DISTINCT COALESCE(subject_id, 0) || ':' || COALESCE(lesson_type_id, 0) || ':' || COALESCE(teacher_id, 0)) > 1'''
+
+
+def naive_free_rooms(session, day, slots):
+    busy = {row[0] for row in session.execute(sa.text(NAIVE_BUSY.format(slots=', '.join(str(int(slot)) for slot in slots))), {'date': day.isoformat()})}
+    return [name for room_id, name in session.query(Room.id, Room.name).order_by(Room.name).all() if room_id not in busy]
+
+
+def timed(fn, repeat, make_args):
+    rnd = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*make_args(rnd))
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--groups', type=int, default=300)
+    ap.add_argument('--weeks', type=int, default=18)
+    ap.add_argument('--repeat', type=int, default=200)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db_session.global_init(os.path.join(tmp, 'bench.db'), checkpoint_interval=0)
+    parser = parser_module.ScheduleParser()
+
+    # Время пересчёта занятости внутри save_weeks
+    spent = [0.0]
+    update = parser_module.update_occupancy
+
+    def timed_update(conn, pairs=None):
+        started = time.perf_counter()
+        update(conn, pairs)
+        spent[0] += time.perf_counter() - started
+    parser_module.update_occupancy = timed_update
+
+    started = time.perf_counter()
+    for group in range(args.groups):
+        weeks = {week: parser.parse_week_html(render_week(40000 + group, week)) for week in range(1, args.weeks + 1)}
+        parser.save_weeks(40000 + group, f'СИН-{group}', weeks)
+    total = time.perf_counter() - started
+    parser_module.update_occupancy = update
+
+    s = db_session.create_session()
+    lessons = s.query(sa.func.count(Lesson.id)).scalar()
+    room_count = s.query(sa.func.count(Room.id)).scalar()
+    print(f'{args.groups} групп × {args.weeks} недель: {lessons} пар, {room_count} аудиторий')
+    print(f'запись парсером {total:6.2f} с, из них пересчёт занятости {spent[0]:5.2f} с ({spent[0] / total:.0%})')
+    started = time.perf_counter()
+    rooms.update_occupancy(s)
+    s.commit()
+    print(f'полная перестройка room_occupancy {time.perf_counter() - started:6.2f} с')
+
+    days = args.weeks * 7
+
+    def random_slot(rnd):
+        return s, SEMESTER_START + timedelta(days=rnd.randrange(days)), [rnd.randint(1, 7)]
+    t_index, _ = timed(rooms.free_rooms, args.repeat, random_slot)
+    t_naive, _ = timed(naive_free_rooms, args.repeat, random_slot)
+    print(f'свободные аудитории (пара):     room_occupancy {t_index * 1000:7.2f} мс   проход по lessons {t_naive * 1000:7.2f} мс')
+
+    def random_pair(rnd):
+        return s, SEMESTER_START + timedelta(days=rnd.randrange(days)), [1, 2]
+    t_index, _ = timed(rooms.free_rooms, args.repeat, random_pair)
+    t_naive, _ = timed(naive_free_rooms, args.repeat, random_pair)
+    print(f'свободные аудитории (две пары): room_occupancy {t_index * 1000:7.2f} мс   проход по lessons {t_naive * 1000:7.2f} мс')
+
+    # Проверка: оба способа дают одинаковый ответ
+    rnd = random.Random(2)
+    for _ in range(20):
+        _, day, slots = random_slot(rnd)
+        assert rooms.free_rooms(s, day, slots) == naive_free_rooms(s, day, slots)
+
+    semester = (SEMESTER_START, SEMESTER_START + timedelta(days=days))
+    t_index, found = timed(rooms.room_conflicts, max(1, args.repeat // 20), lambda rnd: (s, *semester))
+    t_naive, naive = timed(lambda *a: s.execute(sa.text(NAIVE_CONFLICTS), {'date_from': semester[0].isoformat(), 'date_to': semester[1].isoformat()}).all(),
+                           max(1, args.repeat // 20), lambda rnd: ())
+    assert sum(len(slots) for _, _, slots in found) == len(naive)
+    print(f'конфликты за семестр ({len(naive)}):  room_occupancy {t_index * 1000:7.2f} мс   проход по lessons {t_naive * 1000:7.2f} мс')
+    s.close()
+
+
+if __name__ == '__main__':
+    main()
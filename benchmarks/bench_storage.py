@@ -0,0 +1,115 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.isu_stub import render_week
+from data import migrations
+from parser import ScheduleParser
+
+# Размер БД и время запросов: прежняя плоская таблица schedule против lessons + справочники.
+# Плоская БД строится как до миграции 2 (с индексами миграции 1), затем её копия мигрируется
+
+FLAT_SCHEDULE = '''CREATE TABLE schedule (
+    id INTEGER NOT NULL PRIMARY KEY, group_name VARCHAR NOT NULL, group_id INTEGER NOT NULL, week_number INTEGER NOT NULL,
+    day_name VARCHAR NOT NULL, date VARCHAR, lesson_number INTEGER NOT NULL, time_slot VARCHAR, subject VARCHAR,
+    lesson_type VARCHAR, teacher VARCHAR, classroom VARCHAR, last_updated DATETIME)'''
+OTHER_TABLES = [
+    'CREATE TABLE notes (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, group_name VARCHAR NOT NULL, week_number INTEGER NOT NULL, day_name VARCHAR NOT NULL, note_text VARCHAR(64) NOT NULL)',
+    'CREATE TABLE materials (id INTEGER PRIMARY KEY, group_name VARCHAR NOT NULL, subject VARCHAR NOT NULL, title VARCHAR NOT NULL, description TEXT, file_path VARCHAR NOT NULL, file_type VARCHAR NOT NULL, teacher_name VARCHAR NOT NULL, upload_date DATETIME, uploaded_by_role VARCHAR)',
+]
+
+# (название, запрос к плоской таблице, тот же запрос в нормализованной БД, параметры).
+# Через представление schedule — совместимость со старым кодом; по lessons — новые запросы по id
+QUERIES = [
+    ('расписание группы (через schedule)', "SELECT * FROM schedule WHERE group_name = ? ORDER BY week_number, lesson_number",
+     "SELECT * FROM schedule WHERE group_name = ? ORDER BY week_number, lesson_number", lambda rnd, n: (f'ФАК-{rnd.randrange(n)}',)),
+    ('расписание группы (по lessons)', "SELECT * FROM schedule WHERE group_id = ? ORDER BY week_number, lesson_number",
+     "SELECT * FROM lessons WHERE group_id = ? ORDER BY week_number, lesson_number", lambda rnd, n: (30000 + rnd.randrange(n),)),
+    ('нагрузка преподавателей (через schedule)', 'SELECT teacher, COUNT(*) FROM schedule GROUP BY teacher',
+     'SELECT teacher, COUNT(*) FROM schedule GROUP BY teacher', lambda rnd, n: ()),
+    ('нагрузка преподавателей (по lessons)', 'SELECT teacher, COUNT(*) FROM schedule GROUP BY teacher',
+     'SELECT teacher_id, COUNT(*) FROM lessons GROUP BY teacher_id', lambda rnd, n: ()),
+]
+
+
+def build_flat(path, groups, weeks):
+    parser = ScheduleParser()
+    conn = sqlite3.connect(path)
+    conn.execute(FLAT_SCHEDULE)
+    for ddl in OTHER_TABLES:
+        conn.execute(ddl)
+    rows = []
+    for group_id in range(groups):
+        for week in range(1, weeks + 1):
+            for day_name, day in parser.parse_week_html(render_week(30000 + group_id, week)).items():
+                for lesson in day['пары']:
+                    rows.append((f'ФАК-{group_id}', 30000 + group_id, week, day_name, day['дата'], lesson['номер_пары'], lesson['время'], lesson['предмет'], lesson['тип'], lesson['преподаватель'], lesson['аудитория'], '2025-10-25 20:05:14.806143'))
+    conn.executemany('INSERT INTO schedule (group_name, group_id, week_number, day_name, date, lesson_number, time_slot, subject, lesson_type, teacher, classroom, last_updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    parser.close()
+    engine = sa.create_engine(f'sqlite:///{path}')
+    for number, description, statements in migrations.MIGRATIONS[:1]:
+        with engine.begin() as c:
+            for statement in statements:
+                c.exec_driver_sql(statement)
+            c.exec_driver_sql(f'PRAGMA user_version = {number}')
+    engine.dispose()
+    return len(rows)
+
+
+def vacuum_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def time_query(path, sql, make_params, groups, repeat):
+    conn = sqlite3.connect(path)
+    rnd = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, make_params(rnd, groups)).fetchall()
+    elapsed = (time.perf_counter() - started) / repeat
+    conn.close()
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--groups', type=int, default=150)
+    ap.add_argument('--weeks', type=int, default=18)
+    ap.add_argument('--repeat', type=int, default=200)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    flat, normalized = os.path.join(tmp, 'flat.db'), os.path.join(tmp, 'normalized.db')
+    rows = build_flat(flat, args.groups, args.weeks)
+    shutil.copy(flat, normalized)
+    engine = sa.create_engine(f'sqlite:///{normalized}')
+    migrations.migrate(engine)
+    engine.dispose()
+
+    size_flat, size_norm = vacuum_size(flat), vacuum_size(normalized)
+    print(f'{args.groups} групп × {args.weeks} недель, {rows} пар')
+    print(f'размер БД:  плоская {size_flat / 1e6:6.2f} МБ   нормализованная {size_norm / 1e6:6.2f} МБ   ({size_norm / size_flat:.0%})')
+    for name, flat_sql, norm_sql, make_params in QUERIES:
+        repeat = args.repeat if make_params(random.Random(), 1) else max(1, args.repeat // 20)
+        t_flat = time_query(flat, flat_sql, make_params, args.groups, repeat)
+        t_norm = time_query(normalized, norm_sql, make_params, args.groups, repeat)
+        print(f'{name:<42} плоская {t_flat * 1000:7.2f} мс   нормализованная {t_norm * 1000:7.2f} мс')
+    shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
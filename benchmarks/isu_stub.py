@@ -0,0 +1,73 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Локальная заглушка schedule_2024_script.php: отдаёт HTML в том же виде, что и ИСУ,
+# но детерминированно по (group_id, week), с настраиваемой задержкой ответа
+
+SEMESTER_START = date(2025, 9, 1)
+DAYS = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
+SUBJECTS = ['Математический анализ', 'Линейная алгебра', 'Программирование', 'История России', 'Физическая культура', 'Английский язык', 'Дискретная математика', 'Физика']
+TYPES = ['Лекция', 'Практика', 'Лабораторная работа']
+TEACHERS = ['Кужаев Арсен Фанилевич', 'Иванова Мария Петровна', 'Петров Сергей Иванович', 'Сидоров Олег Викторович', 'Галиева Алина Ринатовна']
+
+
+def render_cell(rnd):
+    subject = rnd.choice(SUBJECTS)
+    lesson_type = rnd.choice(TYPES)
+    teacher = rnd.choice(TEACHERS)
+    room = f'Корпус {rnd.randint(1, 11)}, ауд. {rnd.randint(100, 520)}'
+    return f'<div class="lesson"><b>{subject} ({lesson_type})<\\/b><br>{teacher}<br><i>{room}<\\/i><\\/div>'
+
+
+def render_week(group_id, week, lessons_per_day=4):
+    rnd = random.Random(group_id * 1000 + week)
+    monday = SEMESTER_START + timedelta(weeks=week - 1)
+    head = ''.join(f'<th class="day">{day} ({(monday + timedelta(days=i)).strftime("%d.%m.%Y")})</th>' for i, day in enumerate(DAYS))
+    cells = []
+    for day_number in range(1, 7):
+        for lesson_number in sorted(rnd.sample(range(1, 8), lessons_per_day)):
+            cells.append(f"$('#{lesson_number}_{day_number}_group').append('{render_cell(rnd)}');")
+    return f'<table><tr>{head}</tr></table>\n<script>\n' + '\n'.join(cells) + '\n</script>'
+
+
+class IsuStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+    fail_every = 0
+    counter = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        form = parse_qs(body)
+        if self.latency:
+            time.sleep(self.latency)
+        IsuStubHandler.counter += 1
+        if self.fail_every and IsuStubHandler.counter % self.fail_every == 0:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        payload = render_week(int(form['group_id'][0]), int(form['week'][0])).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(latency=0.0, fail_every=0):
+    IsuStubHandler.latency = latency
+    IsuStubHandler.fail_every = fail_every
+    IsuStubHandler.counter = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), IsuStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/module/schedule/schedule_2024_script.php'
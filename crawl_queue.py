@@ -0,0 +1,130 @@
+import os
+import socket
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from data import db_session
+from data.crawl_tasks import CrawlTask
+
+# Очередь задач (группа, неделя) в SQLite: воркеры берут задачи в аренду (lease),
+# по истечении аренды задачу может забрать другой воркер — так переживаем падения
+
+tasks = CrawlTask.__table__
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(groups, start_week=1, end_week=18, fresh_hours=6):
+    # Добавляет недостающие задачи и возвращает в очередь те, что завершились раньше,
+    # чем fresh_hours часов назад. Свежие и уже взятые в работу задачи не трогает
+    now = datetime.now()
+    rows = [{'group_id': group['id'], 'group_name': group['name'], 'week_number': week, 'status': 'pending', 'attempts': 0}
+            for group in groups for week in range(start_week, end_week + 1)]
+    s = db_session.create_session()
+    try:
+        s.execute(sqlite_insert(tasks).on_conflict_do_nothing(index_elements=['group_id', 'week_number']), rows)
+        group_ids = [group['id'] for group in groups]
+        requeued = s.execute(tasks.update().where(tasks.c.group_id.in_(group_ids), tasks.c.week_number.between(start_week, end_week),
+                                                  tasks.c.status.in_(['done', 'failed']), sa.or_(tasks.c.finished_at.is_(None), tasks.c.finished_at < now - timedelta(hours=fresh_hours)))
+                             .values(status='pending', attempts=0, last_error=None)).rowcount
+        s.commit()
+        return requeued
+    finally:
+        s.close()
+
+
+def claim(owner, limit=18, lease_seconds=300, shard=0, shards=1):
+    # Атомарно забирает до limit задач одним UPDATE ... RETURNING; шард — остаток group_id % shards.
+    # Задачи упорядочены по группе, чтобы недели одной группы попадали к одному воркеру
+    now = datetime.now()
+    claimable = sa.or_(tasks.c.status == 'pending', sa.and_(tasks.c.status == 'leased', tasks.c.lease_expires < now))
+    if shards > 1:
+        claimable = sa.and_(claimable, tasks.c.group_id % shards == shard)
+    ids = sa.select(tasks.c.id).where(claimable).order_by(tasks.c.group_id, tasks.c.week_number).limit(limit).scalar_subquery()
+    q = (tasks.update().where(tasks.c.id.in_(ids))
+         .values(status='leased', lease_owner=owner, lease_expires=now + timedelta(seconds=lease_seconds), attempts=tasks.c.attempts + 1)
+         .returning(tasks.c.group_id, tasks.c.group_name, tasks.c.week_number))
+    s = db_session.create_session()
+    try:
+        claimed = [tuple(row) for row in s.execute(q).all()]
+        s.commit()
+        return claimed
+    finally:
+        s.close()
+
+
+def complete(owner, report, max_attempts=5):
+    # Отмечает результат обхода; неудачные задачи возвращаются в очередь до max_attempts попыток.
+    # Задачи, аренду которых уже перехватил другой воркер, не трогаем
+    now = datetime.now()
+    done, failed = [], []
+    for r in report:
+        key = {'key_group': r['group_id'], 'key_week': r['week']}
+        if r['status'] in ('ok', 'empty'):
+            done.append({**key, 'result': r['write'] or r['status']})
+        else:
+            failed.append({**key, 'error': r['error'] or r['status']})
+    mine = sa.and_(tasks.c.group_id == sa.bindparam('key_group'), tasks.c.week_number == sa.bindparam('key_week'), tasks.c.lease_owner == owner, tasks.c.status == 'leased')
+    s = db_session.create_session()
+    try:
+        if done:
+            s.execute(tasks.update().where(mine).values(status='done', finished_at=now, result=sa.bindparam('result'), last_error=None, lease_expires=None), done)
+        if failed:
+            s.execute(tasks.update().where(mine).values(status=sa.case((tasks.c.attempts >= max_attempts, 'failed'), else_='pending'),
+                                                        finished_at=now, last_error=sa.bindparam('error'), lease_expires=None), failed)
+        s.commit()
+    finally:
+        s.close()
+
+
+def work(parser, owner=None, batch=18, lease_seconds=300, shard=0, shards=1, max_attempts=5):
+    # Разбирает очередь, пока в ней есть доступные задачи; возвращает общий отчёт
+    owner = owner or worker_name()
+    report = []
+    while True:
+        claimed = claim(owner, batch, lease_seconds, shard, shards)
+        if not claimed:
+            return report
+        batch_report = parser.crawl_tasks(claimed)
+        complete(owner, batch_report, max_attempts)
+        report.extend(batch_report)
+
+
+def status():
+    s = db_session.create_session()
+    try:
+        now = datetime.now()
+        leased_live = sa.and_(tasks.c.status == 'leased', tasks.c.lease_expires >= now)
+        totals = dict(s.execute(sa.select(tasks.c.status, sa.func.count()).group_by(tasks.c.status)).all())
+        per_group = OrderedDict()
+        q = (sa.select(tasks.c.group_name, sa.func.count(), sa.func.sum(sa.case((tasks.c.status == 'done', 1), else_=0)),
+                       sa.func.sum(sa.case((tasks.c.status == 'failed', 1), else_=0)), sa.func.max(tasks.c.finished_at))
+             .group_by(tasks.c.group_name).order_by(tasks.c.group_name))
+        for group_name, total, done, failed, last in s.execute(q).all():
+            per_group[group_name] = {'total': total, 'done': done, 'failed': failed, 'last_finished': last}
+        workers = dict(s.execute(sa.select(tasks.c.lease_owner, sa.func.count()).where(leased_live).group_by(tasks.c.lease_owner)).all())
+        errors = s.execute(sa.select(tasks.c.group_name, tasks.c.week_number, tasks.c.attempts, tasks.c.last_error)
+                           .where(tasks.c.last_error.is_not(None)).order_by(tasks.c.group_name, tasks.c.week_number)).all()
+        return {'totals': totals, 'groups': per_group, 'workers': workers, 'errors': errors}
+    finally:
+        s.close()
+
+
+def print_status():
+    st = status()
+    total = sum(st['totals'].values())
+    done = st['totals'].get('done', 0)
+    print(f"📋 Задач: {total}, готово {done} ({done / total * 100 if total else 0:.0f}%), "
+          f"в очереди {st['totals'].get('pending', 0)}, в работе {st['totals'].get('leased', 0)}, с ошибкой {st['totals'].get('failed', 0)}")
+    for owner, count in st['workers'].items():
+        print(f"  ⚙️ {owner}: {count} задач в аренде")
+    for group_name, g in st['groups'].items():
+        last = g['last_finished'].strftime('%Y-%m-%d %H:%M') if g['last_finished'] else '—'
+        print(f"  {group_name}: {g['done']}/{g['total']}, ошибок {g['failed']}, последнее завершение {last}")
+    for group_name, week, attempts, error in st['errors']:
+        print(f"  ❌ {group_name} неделя {week} (попыток {attempts}): {error}")
@@ -1,4 +1,10 @@
 from . import users
 from . import schedule
 from . import notes
-from . import materials
\ No newline at end of file
+from . import materials
+from . import week_fingerprints
+from . import crawl_tasks
+from . import lookups
+from . import rooms
+from . import blobs
+from . import upload_sessions
\ No newline at end of file
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import re
+import tempfile
+from datetime import datetime
+import sqlalchemy
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from .db_session import SqlAlchemyBase
+
+# Хранилище загрузок по содержимому: файл лежит в uploads/<2 первых символа sha256>/<sha256>,
+# одинаковые файлы хранятся один раз. blobs.refs — число материалов с этим content_hash;
+# счётчик ведут триггеры на materials, файл удаляется, когда ссылок не осталось
+
+CHUNK = 1024 * 1024  # байт
+PLACED = 'placed_blobs'  # ключ в session.info: {sha256: папка загрузок} файлов под ещё не закоммиченными строками blobs
+
+
+class Blob(SqlAlchemyBase):
+    __tablename__ = 'blobs'
+
+    sha256 = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    size = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    refs = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    created_at = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.func.now())
+    # Извлечение текста для поиска (text_index.py): NULL — в очереди, queued, done, empty, unsupported, failed
+    text_status = sqlalchemy.Column(sqlalchemy.String, nullable=True)
+    text_extracted_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True)
+    text_claimed_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True)  # когда задачу взяли в queued
+
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs={self.refs}>'
+
+
+# Выполняется миграцией 9 и при создании новой БД (migrations.stamp); всё идемпотентно
+BLOB_SCHEMA = [
+    'CREATE TRIGGER IF NOT EXISTS materials_blob_insert AFTER INSERT ON materials WHEN new.content_hash IS NOT NULL BEGIN '
+    'UPDATE blobs SET refs = refs + 1 WHERE sha256 = new.content_hash; END',
+    'CREATE TRIGGER IF NOT EXISTS materials_blob_delete AFTER DELETE ON materials WHEN old.content_hash IS NOT NULL BEGIN '
+    'UPDATE blobs SET refs = refs - 1 WHERE sha256 = old.content_hash; END',
+    'CREATE TRIGGER IF NOT EXISTS materials_blob_update AFTER UPDATE OF content_hash ON materials WHEN old.content_hash IS NOT new.content_hash BEGIN '
+    'UPDATE blobs SET refs = refs - 1 WHERE sha256 = old.content_hash; '
+    'UPDATE blobs SET refs = refs + 1 WHERE sha256 = new.content_hash; END',
+]
+
+
+def blob_key(sha256):
+    # Путь файла относительно папки загрузок; он же пишется в materials.file_path
+    return f'{sha256[:2]}/{sha256}'
+
+
+def material_file(root, file_path):
+    # Старые строки хранят абсолютный путь — join вернёт его как есть
+    return os.path.join(root, file_path)
+
+
+def _place(session, tmp, sha256, size, root):
+    # Строка blobs вставляется до переноса файла, то есть файл встаёт под блокировкой записи — collect_garbage
+    # не может удалить его между вставкой и коммитом. Коммит — за вызывающим, вместе со строками materials
+    if session.execute(insert(Blob).values(sha256=sha256, size=size, refs=0, created_at=datetime.now()).on_conflict_do_nothing()).rowcount:
+        session.info.setdefault(PLACED, {})[sha256] = root
+    path = material_file(root, blob_key(sha256))
+    if os.path.exists(path):
+        os.remove(tmp)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+    return sha256, blob_key(sha256)
+
+
+def store_upload(session, stream, root):
+    # Пишет поток во временный файл, считая sha256 на лету, и ставит его на место; возвращает (sha256, ключ)
+    os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=os.path.join(root, 'tmp'))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(CHUNK), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        return _place(session, tmp, digest.hexdigest(), size, root)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def store_file(session, path, root):
+    # То же для уже записанного файла (загрузка частями): хеш считается чтением по CHUNK, файл переносится без копирования
+    digest, size = hashlib.sha256(), 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return _place(session, path, digest.hexdigest(), size, root)
+
+
+def _remove(root, sha256):
+    # Файл и опустевшая папка префикса. Вызывать под блокировкой записи: _place создаёт папку тоже под ней
+    path = material_file(root, blob_key(sha256))
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass  # в папке есть другие файлы
+
+
+def collect_garbage(session, root):
+    # Удаляет файлы без ссылок. Строка и файл удаляются в одной транзакции записи: загрузка того же содержимого
+    # либо уже подняла refs, либо вставит строку заново и положит файл сама
+    orphans = session.execute(sqlalchemy.text('DELETE FROM blobs WHERE refs <= 0 RETURNING sha256')).scalars().all()
+    for sha256 in orphans:
+        _remove(root, sha256)
+    session.commit()
+    return orphans
+
+
+@sqlalchemy.event.listens_for(Session, 'after_commit')
+def _keep_placed(session):
+    session.info.pop(PLACED, None)
+
+
+@sqlalchemy.event.listens_for(Session, 'after_transaction_end')
+def _discard_placed(session, transaction):
+    # Транзакция с новыми строками blobs закончилась без коммита (ошибка, rollback, close): строк нет, а файлы уже на месте.
+    # Удаляем их в новой транзакции под блокировкой записи и только если строки так и нет — иначе файл уже взяла
+    # параллельная загрузка того же содержимого
+    if transaction.parent is not None or not session.info.get(PLACED):
+        return
+    placed = session.info.pop(PLACED)
+    try:
+        with session.get_bind().begin() as conn:
+            conn.exec_driver_sql('UPDATE blobs SET refs = refs WHERE 0')  # берёт блокировку записи
+            kept = set(conn.execute(sqlalchemy.select(Blob.sha256).where(Blob.sha256.in_(list(placed)))).scalars())
+            for sha256, root in placed.items():
+                if sha256 not in kept:
+                    _remove(root, sha256)
+    except sqlalchemy.exc.SQLAlchemyError as e:
+        print(f'❌ Файлы откаченной загрузки не удалены: {e}')
+
+
+def adopt_files(session, root):
+    # Разовый перенос загрузок, сохранённых до хранилища по содержимому. Файл ищется по file_path, затем по имени
+    # в root (пути с другой машины); копии одного файла сливаются. Возвращает (перенесено, [id без файла])
+    from .materials import Material
+    adopted, missing, sources = 0, [], set()
+    for material in session.query(Material).filter(Material.content_hash.is_(None)).order_by(Material.id).all():
+        name = re.split(r'[\\/]', material.file_path)[-1]
+        source = next((path for path in (material_file(root, material.file_path), os.path.join(root, name)) if os.path.isfile(path)), None)
+        if not source:
+            missing.append(material.id)
+            continue
+        with open(source, 'rb') as f:
+            sha256, key = store_upload(session, f, root)
+        material.content_hash, material.file_path, material.file_name = sha256, key, material.file_name or name
+        sources.add(os.path.abspath(source))
+        adopted += 1
+    session.commit()
+    for source in sources:
+        if os.path.dirname(source) == os.path.abspath(root):
+            os.remove(source)
+    return adopted, missing
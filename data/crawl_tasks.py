@@ -0,0 +1,23 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+
+
+class CrawlTask(SqlAlchemyBase):
+    __tablename__ = 'crawl_tasks'
+    __table_args__ = (sqlalchemy.UniqueConstraint('group_id', 'week_number'),
+                      sqlalchemy.Index('ix_crawl_tasks_claim', 'status', 'group_id', 'week_number'))
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    group_id = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    group_name = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    week_number = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    status = sqlalchemy.Column(sqlalchemy.String, nullable=False, default='pending')  # pending, leased, done, failed
+    lease_owner = sqlalchemy.Column(sqlalchemy.String)  # хост:pid воркера, взявшего задачу
+    lease_expires = sqlalchemy.Column(sqlalchemy.DateTime)  # после этого момента задачу может забрать другой воркер
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    finished_at = sqlalchemy.Column(sqlalchemy.DateTime)
+    result = sqlalchemy.Column(sqlalchemy.String)  # new / updated / unchanged / empty
+    last_error = sqlalchemy.Column(sqlalchemy.String)
+
+    def __repr__(self):
+        return f'<CrawlTask {self.group_name} week={self.week_number} {self.status}>'
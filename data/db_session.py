@@ -1,21 +1,111 @@
+import threading
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
 from sqlalchemy.orm import Session
+from . import migrations
 
 SqlAlchemyBase = orm.declarative_base()
+# Модели поверх представлений (VIEW): у них своя metadata, create_all их не создаёт
+ViewBase = orm.declarative_base()
 __factory = None
+__read_factory = None
+__checkpointer = None
 
-def global_init(db_file):
-    global __factory
+# Настройки SQLite для обоих движков. WAL позволяет читать, пока парсер пишет;
+# busy_timeout — ждать блокировку вместо мгновенного "database is locked"
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 10000,  # мс
+    'synchronous': 'NORMAL',  # в режиме WAL безопасно и заметно быстрее FULL
+    'cache_size': -32000,  # отрицательное значение — в КиБ (32 МБ на соединение)
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'wal_autocheckpoint': 1000,  # страниц
+}
+
+
+def _set_pragmas(pragmas, read_only=False):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if read_only:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+    return on_connect
+
+
+def _checkpoint_loop(engine, interval, stop):
+    # Периодический checkpoint не даёт WAL-файлу разрастаться при постоянных читателях
+    while not stop.wait(interval):
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)')
+        except sa.exc.OperationalError:
+            pass
+
+
+def global_init(db_file, journal_mode='WAL', read_pool_size=8, checkpoint_interval=300, pragmas=None):
+    global __factory, __read_factory, __checkpointer
     if __factory:
         return
     if not db_file or not db_file.strip():
         raise Exception("Необходимо указать файл базы данных.")
-    conn_str = f'sqlite:///{db_file.strip()}?check_same_thread=False'
-    engine = sa.create_engine(conn_str, echo=False)
+    conn_str = f'sqlite:///{db_file.strip()}'
+    pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+    connect_args = {'check_same_thread': False}
+    engine = sa.create_engine(conn_str, echo=False, connect_args=connect_args)
+    sa.event.listen(engine, 'connect', _set_pragmas(pragmas))
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f'PRAGMA journal_mode = {journal_mode}')
+    read_engine = sa.create_engine(conn_str, echo=False, connect_args=connect_args, pool_size=read_pool_size, max_overflow=read_pool_size, pool_timeout=30)
+    sa.event.listen(read_engine, 'connect', _set_pragmas(pragmas, read_only=True))
     __factory = orm.sessionmaker(bind=engine)
+    __read_factory = orm.sessionmaker(bind=read_engine)
+    from . import __all_models
+    fresh = not sa.inspect(engine).get_table_names()
     SqlAlchemyBase.metadata.create_all(engine)
+    if fresh:
+        migrations.stamp(engine)
+    migrations.migrate(engine)
+    if checkpoint_interval and journal_mode.upper() == 'WAL':
+        stop = threading.Event()
+        thread = threading.Thread(target=_checkpoint_loop, args=(engine, checkpoint_interval, stop), daemon=True)
+        thread.start()
+        __checkpointer = stop, thread
+
+
+def shutdown():
+    # Останавливает фоновый checkpoint, переносит WAL в файл БД и закрывает соединения; после него нужен новый global_init
+    global __factory, __read_factory, __checkpointer
+    if __checkpointer:
+        stop, thread = __checkpointer
+        stop.set()
+        thread.join()
+        __checkpointer = None
+    if __factory:
+        engine, read_engine = engines()
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)')
+        except sa.exc.OperationalError:
+            pass
+        engine.dispose()
+        read_engine.dispose()
+        __factory = __read_factory = None
+
+
+def engines():
+    # (писатель, читатель) — например, чтобы повесить обработчики событий пула
+    return __factory.kw['bind'], __read_factory.kw['bind']
+
 
 def create_session() -> Session:
+    # Сессия для записи (парсер, загрузки, заметки)
     global __factory
-    return __factory()
\ No newline at end of file
+    return __factory()
+
+
+def create_read_session() -> Session:
+    # Сессия только для чтения (страницы и API); в ней нельзя ничего записать
+    global __read_factory
+    return __read_factory()
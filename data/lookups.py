@@ -0,0 +1,79 @@
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+
+# Справочники для нормализованного расписания (lessons): длинные строки хранятся один раз,
+# в lessons — только целочисленные ссылки
+
+
+class StudyGroup(SqlAlchemyBase):
+    __tablename__ = 'study_groups'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=False)  # group_id из ИСУ
+    name = sqlalchemy.Column(sqlalchemy.String, nullable=False, unique=True)
+    version = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default='0')  # растёт при каждом изменении расписания группы
+    # Справочник групп для страниц и /api/groups; поддерживается парсером (refresh_group_stats)
+    lesson_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default='0')
+    week_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default='0')  # недель с парами
+    first_week = sqlalchemy.Column(sqlalchemy.Integer)
+    last_week = sqlalchemy.Column(sqlalchemy.Integer)
+    refreshed_at = sqlalchemy.Column(sqlalchemy.DateTime)  # последняя проверка в ИСУ
+
+    def __repr__(self):
+        return f'<StudyGroup {self.id} {self.name}>'
+
+
+class Subject(SqlAlchemyBase):
+    __tablename__ = 'subjects'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    name = sqlalchemy.Column(sqlalchemy.String, nullable=False, unique=True)
+
+
+class Teacher(SqlAlchemyBase):
+    __tablename__ = 'teachers'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    name = sqlalchemy.Column(sqlalchemy.String, nullable=False, unique=True)
+
+
+class Room(SqlAlchemyBase):
+    __tablename__ = 'rooms'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    name = sqlalchemy.Column(sqlalchemy.String, nullable=False, unique=True)  # 'Корпус 1, ауд. 305'
+
+
+class LessonType(SqlAlchemyBase):
+    __tablename__ = 'lesson_types'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    name = sqlalchemy.Column(sqlalchemy.String, nullable=False, unique=True)
+
+
+class TimeSlot(SqlAlchemyBase):
+    __tablename__ = 'time_slots'
+
+    lesson_number = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=False)
+    time = sqlalchemy.Column(sqlalchemy.String, nullable=False)  # 08:00-09:20
+
+
+# Таблица справочника по имени колонки в плоском представлении schedule
+LOOKUPS = {'subject': Subject, 'lesson_type': LessonType, 'teacher': Teacher, 'classroom': Room}
+
+
+
+def refresh_group_stats(conn, group_id=None, refreshed_at=None):
+    # Пересчитывает число пар и покрытие недель (по индексу lessons с group_id в начале); без group_id — для всех групп
+    from .schedule import Lesson
+    groups, lessons = StudyGroup.__table__, Lesson.__table__
+    of_group = lessons.c.group_id == groups.c.id
+    values = {'lesson_count': sqlalchemy.select(sqlalchemy.func.count()).where(of_group).scalar_subquery(),
+              'week_count': sqlalchemy.select(sqlalchemy.func.count(lessons.c.week_number.distinct())).where(of_group).scalar_subquery(),
+              'first_week': sqlalchemy.select(sqlalchemy.func.min(lessons.c.week_number)).where(of_group).scalar_subquery(),
+              'last_week': sqlalchemy.select(sqlalchemy.func.max(lessons.c.week_number)).where(of_group).scalar_subquery()}
+    if refreshed_at is not None:
+        values['refreshed_at'] = refreshed_at
+    q = groups.update().values(**values)
+    if group_id is not None:
+        q = q.where(groups.c.id == group_id)
+    conn.execute(q)
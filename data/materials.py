@@ -1,3 +1,4 @@
+import json
 import sqlalchemy
 from sqlalchemy import orm
 from .db_session import SqlAlchemyBase
@@ -5,13 +6,18 @@ from .db_session import SqlAlchemyBase
 
 class Material(SqlAlchemyBase):
     __tablename__ = 'materials'
+    __table_args__ = (sqlalchemy.Index('ix_materials_group_date', 'group_name', 'upload_date'),
+                      sqlalchemy.Index('ix_materials_teacher_date', 'teacher_name', 'upload_date'),
+                      sqlalchemy.Index('ix_materials_content_hash', 'content_hash'))
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     group_name = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     subject = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     title = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     description = sqlalchemy.Column(sqlalchemy.Text, nullable=True)
-    file_path = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    file_path = sqlalchemy.Column(sqlalchemy.String, nullable=False)  # относительно папки загрузок (у старых строк — абсолютный)
+    file_name = sqlalchemy.Column(sqlalchemy.String, nullable=True)  # имя файла при скачивании
+    content_hash = sqlalchemy.Column(sqlalchemy.String, nullable=True)  # sha256 файла в хранилище (data/blobs.py)
     file_type = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     teacher_name = sqlalchemy.Column(sqlalchemy.String, nullable=False)
     upload_date = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.func.now())
@@ -20,4 +26,40 @@ class Material(SqlAlchemyBase):
     uploaded_by_role = sqlalchemy.Column(sqlalchemy.String, default='teacher')
 
     def __repr__(self):
-        return f'<Material {self.title}>'
\ No newline at end of file
+        return f'<Material {self.title}>'
+
+
+PAGE_COLUMNS = 'id, group_name, subject, title, description, file_type, teacher_name, upload_date, uploaded_by_role'
+PAGE_FILTERS = ('group_name', 'teacher_name', 'file_type', 'uploaded_by_role')
+
+
+def material_page(session, limit=20, after=None, subject=None, **filters):
+    # Страница материалов от новых к старым по ключу (upload_date, id): следующая страница начинается строго после
+    # курсора и идёт по ix_materials_group_date / ix_materials_teacher_date без OFFSET.
+    # filters — group_name, teacher_name, file_type, uploaded_by_role. На первой странице (after=None) тем же запросом
+    # считается число материалов по предметам со всеми фильтрами, кроме предмета. Возвращает (строки, курсор или None, {предмет: число} или None)
+    where, params = [], {'limit': limit + 1}
+    for name in PAGE_FILTERS:
+        if filters.get(name) is not None:
+            where.append(f'{name} = :{name}')
+            params[name] = filters[name]
+    base = ' AND '.join(where) or '1'
+    page_where = base
+    if subject is not None:
+        page_where += ' AND subject = :subject'
+        params['subject'] = subject
+    if after:
+        # Курсор — upload_date в том виде, как она лежит в БД, и id: «ГГГГ-ММ-ДД ЧЧ:ММ:СС.ffffff|id»
+        after_date, after_id = after.rsplit('|', 1)
+        page_where += ' AND (upload_date, id) < (:after_date, :after_id)'
+        params.update(after_date=after_date, after_id=int(after_id))
+    counts = 'NULL' if after else f'(SELECT json_group_object(subject, n) FROM (SELECT subject, COUNT(*) AS n FROM materials WHERE {base} GROUP BY subject ORDER BY subject))'
+    # Строка счётчиков одна и присоединяется к странице через LEFT JOIN — так она приходит и при пустой странице
+    sql = sqlalchemy.text(f'''SELECT c.counts, p.* FROM (SELECT {counts} AS counts) c
+        LEFT JOIN (SELECT {PAGE_COLUMNS}, upload_date AS cursor_date FROM materials WHERE {page_where} ORDER BY upload_date DESC, id DESC LIMIT :limit) p ON 1
+        ORDER BY p.upload_date DESC, p.id DESC''').columns(upload_date=sqlalchemy.DateTime)
+    rows = session.execute(sql, params).all()
+    subject_counts = json.loads(rows[0].counts) if rows[0].counts else ({} if not after else None)
+    rows = [row for row in rows if row.id is not None]
+    next_cursor = f'{rows[limit - 1].cursor_date}|{rows[limit - 1].id}' if len(rows) > limit else None
+    return rows[:limit], next_cursor, subject_counts
\ No newline at end of file
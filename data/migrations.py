@@ -0,0 +1,231 @@
+import sys
+import sqlalchemy as sa
+from .search import FILE_TEXT_SCHEMA, SEARCH_FILL, SEARCH_SCHEMA
+
+# Версионные миграции схемы. create_all создаёт только новые таблицы и не меняет существующие,
+# поэтому всё, что нужно добавить в уже работающую БД (индексы, колонки), описывается здесь.
+# Номер применённой версии хранится в PRAGMA user_version.
+# Каждая миграция — (версия, описание, список шагов), выполняется в одной транзакции;
+# шаг — SQL-строка или функция, принимающая соединение.
+# Новая БД создаётся сразу в актуальной схеме (create_all + stamp) и миграции не проходит.
+
+DAY_CASE = "CASE {col} WHEN 1 THEN 'Понедельник' WHEN 2 THEN 'Вторник' WHEN 3 THEN 'Среда' WHEN 4 THEN 'Четверг' WHEN 5 THEN 'Пятница' WHEN 6 THEN 'Суббота' END"
+DAY_NUMBER_CASE = "CASE {col} WHEN 'Понедельник' THEN 1 WHEN 'Вторник' THEN 2 WHEN 'Среда' THEN 3 WHEN 'Четверг' THEN 4 WHEN 'Пятница' THEN 5 WHEN 'Суббота' THEN 6 END"
+
+# Прежняя плоская таблица schedule как представление над lessons и справочниками
+SCHEDULE_VIEW = f"""
+CREATE VIEW IF NOT EXISTS schedule AS
+SELECT l.id AS id, g.name AS group_name, l.group_id AS group_id, l.week_number AS week_number,
+       {DAY_CASE.format(col='l.day')} AS day_name, COALESCE(strftime('%d.%m.%Y', l.date), '') AS date,
+       l.lesson_number AS lesson_number, ts.time AS time_slot, subj.name AS subject, lt.name AS lesson_type,
+       t.name AS teacher, r.name AS classroom, l.last_updated AS last_updated
+FROM lessons l
+JOIN study_groups g ON g.id = l.group_id
+LEFT JOIN time_slots ts ON ts.lesson_number = l.lesson_number
+LEFT JOIN subjects subj ON subj.id = l.subject_id
+LEFT JOIN lesson_types lt ON lt.id = l.lesson_type_id
+LEFT JOIN teachers t ON t.id = l.teacher_id
+LEFT JOIN rooms r ON r.id = l.room_id
+"""
+
+VIEWS = [SCHEDULE_VIEW]
+
+
+def create_tables(conn):
+    from .db_session import SqlAlchemyBase
+    from . import __all_models
+    SqlAlchemyBase.metadata.create_all(conn)
+
+
+def fill_room_occupancy(conn):
+    from .rooms import update_occupancy
+    update_occupancy(conn)
+
+
+def fill_group_stats(conn):
+    from .lookups import refresh_group_stats
+    refresh_group_stats(conn)
+    conn.exec_driver_sql('UPDATE study_groups SET refreshed_at = (SELECT MAX(checked_at) FROM week_fingerprints WHERE group_id = study_groups.id)')
+
+
+def create_blob_triggers(conn):
+    from .blobs import BLOB_SCHEMA
+    for statement in BLOB_SCHEMA:
+        conn.exec_driver_sql(statement)
+
+
+def add_column(table, column, ddl):
+    # Таблица могла быть создана create_all уже с этой колонкой (модель новее БД)
+    def step(conn):
+        if column not in [row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({table})').all()]:
+            conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+    return step
+
+
+MIGRATIONS = [
+    (1, 'индексы для горячих запросов', [
+        'CREATE INDEX IF NOT EXISTS ix_schedule_group_week_lesson ON schedule (group_name, week_number, lesson_number)',
+        'CREATE INDEX IF NOT EXISTS ix_schedule_groupid_week ON schedule (group_id, week_number)',
+        # Перед уникальным индексом убираем дубли заметок, оставляя последнюю
+        'DELETE FROM notes WHERE id NOT IN (SELECT MAX(id) FROM notes GROUP BY user_id, group_name, week_number, day_name)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_notes_user_group_week_day ON notes (user_id, group_name, week_number, day_name)',
+        'CREATE INDEX IF NOT EXISTS ix_materials_group_date ON materials (group_name, upload_date)',
+        'CREATE INDEX IF NOT EXISTS ix_materials_teacher_date ON materials (teacher_name, upload_date)',
+    ]),
+    (2, 'нормализованное расписание: lessons + справочники, schedule становится представлением', [
+        create_tables,
+        'INSERT OR IGNORE INTO study_groups (id, name) SELECT group_id, MAX(group_name) FROM schedule GROUP BY group_id',
+        'INSERT OR IGNORE INTO subjects (name) SELECT DISTINCT subject FROM schedule WHERE subject IS NOT NULL',
+        'INSERT OR IGNORE INTO lesson_types (name) SELECT DISTINCT lesson_type FROM schedule WHERE lesson_type IS NOT NULL',
+        'INSERT OR IGNORE INTO teachers (name) SELECT DISTINCT teacher FROM schedule WHERE teacher IS NOT NULL',
+        'INSERT OR IGNORE INTO rooms (name) SELECT DISTINCT classroom FROM schedule WHERE classroom IS NOT NULL',
+        "INSERT OR IGNORE INTO time_slots (lesson_number, time) SELECT lesson_number, MAX(time_slot) FROM schedule WHERE time_slot != '' GROUP BY lesson_number",
+        # id строк сохраняются
+        f"""INSERT INTO lessons (id, group_id, week_number, day, date, lesson_number, subject_id, lesson_type_id, teacher_id, room_id, last_updated)
+            SELECT s.id, s.group_id, s.week_number, {DAY_NUMBER_CASE.format(col='s.day_name')},
+                   CASE WHEN s.date GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]' THEN substr(s.date, 7, 4) || '-' || substr(s.date, 4, 2) || '-' || substr(s.date, 1, 2) END,
+                   s.lesson_number, subj.id, lt.id, t.id, r.id, s.last_updated
+            FROM schedule s
+            LEFT JOIN subjects subj ON subj.name = s.subject
+            LEFT JOIN lesson_types lt ON lt.name = s.lesson_type
+            LEFT JOIN teachers t ON t.name = s.teacher
+            LEFT JOIN rooms r ON r.name = s.classroom
+            WHERE {DAY_NUMBER_CASE.format(col='s.day_name')} IS NOT NULL""",
+        'DROP TABLE schedule',
+        SCHEDULE_VIEW,
+    ]),
+    (3, 'версия расписания группы для инвалидации кэшей', [
+        add_column('study_groups', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ]),
+    (4, 'индекс пар по дате для запросов на день и период', [
+        'CREATE INDEX IF NOT EXISTS ix_lessons_group_date ON lessons (group_id, date)',
+    ]),
+    (5, 'индекс расписания преподавателя по всем группам', [
+        'CREATE INDEX IF NOT EXISTS ix_lessons_teacher_week ON lessons (teacher_id, week_number, day, lesson_number)',
+    ]),
+    (6, 'занятость аудиторий по датам и парам', [
+        create_tables,
+        'CREATE INDEX IF NOT EXISTS ix_lessons_room_date ON lessons (room_id, date)',
+        fill_room_occupancy,
+    ]),
+    (7, 'полнотекстовый поиск по расписанию и материалам (FTS5)', SEARCH_SCHEMA + SEARCH_FILL + [
+        'CREATE INDEX IF NOT EXISTS ix_lessons_subject_group ON lessons (subject_id, group_id)',
+    ]),
+    (8, 'справочник групп: число пар, покрытие недель, время обновления', [
+        add_column('study_groups', 'lesson_count', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('study_groups', 'week_count', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('study_groups', 'first_week', 'INTEGER'),
+        add_column('study_groups', 'last_week', 'INTEGER'),
+        add_column('study_groups', 'refreshed_at', 'DATETIME'),
+        fill_group_stats,
+    ]),
+    # Сами файлы переносит в хранилище отдельная команда: python adopt_uploads.py [БД] [папка загрузок]
+    (9, 'хранилище загрузок по содержимому со счётчиком ссылок', [
+        create_tables,
+        add_column('materials', 'file_name', 'VARCHAR'),
+        add_column('materials', 'content_hash', 'VARCHAR'),
+        create_blob_triggers,
+    ]),
+    (10, 'загрузка файлов частями с докачкой', [
+        create_tables,
+    ]),
+    # Текст уже загруженных файлов извлекает python text_index.py
+    (11, 'поиск по тексту загруженных файлов', [
+        add_column('blobs', 'text_status', 'VARCHAR'),
+        add_column('blobs', 'text_extracted_at', 'DATETIME'),
+        'CREATE INDEX IF NOT EXISTS ix_materials_content_hash ON materials (content_hash)',
+    ] + FILE_TEXT_SCHEMA),
+    (12, 'время взятия файла в извлечение текста: зависшие задачи берутся заново', [
+        add_column('blobs', 'text_claimed_at', 'DATETIME'),
+    ]),
+]
+
+# Запросы из app.py и parser.py, которые должны идти по индексу: (название, SQL, параметры)
+HOT_QUERIES = [
+    ('расписание группы', 'SELECT * FROM schedule WHERE group_name = ? ORDER BY week_number, lesson_number', ('ТОП-103Б',)),
+    ('неделя группы', 'SELECT * FROM lessons WHERE group_id = ? AND week_number IN (?) ORDER BY week_number, lesson_number, id', (10990, 9)),
+    ('пары группы за период', 'SELECT * FROM lessons WHERE group_id = ? AND date >= ? AND date <= ?', (10990, '2025-10-27', '2025-11-02')),
+    ('расписание преподавателя', 'SELECT * FROM lessons WHERE teacher_id = ? ORDER BY week_number, day, lesson_number', (1,)),
+    ('неделя преподавателя', 'SELECT * FROM lessons WHERE teacher_id = ? AND week_number IN (?) ORDER BY week_number, day, lesson_number', (1, 9)),
+    ('занятость аудиторий за дату', 'SELECT room_id, slots FROM room_occupancy WHERE date = ?', ('2025-10-29',)),
+    ('пересчёт занятости аудитории', 'SELECT * FROM lessons WHERE room_id = ? AND date = ?', (1, '2025-10-29')),
+    ('группы предмета (поиск)', 'SELECT DISTINCT group_id FROM lessons WHERE subject_id = ?', (1,)),
+    ('недели группы (парсер)', 'SELECT * FROM lessons WHERE group_id = ? AND week_number IN (?, ?) ORDER BY week_number, id', (10990, 1, 2)),
+    ('заметка на день', 'SELECT * FROM notes WHERE user_id = ? AND group_name = ? AND week_number = ? AND day_name = ?', (1, 'ТОП-103Б', 9, 'Понедельник')),
+    ('все заметки группы', 'SELECT * FROM notes WHERE user_id = ? AND group_name = ?', (1, 'ТОП-103Б')),
+    ('материалы группы', 'SELECT * FROM materials WHERE group_name = ? ORDER BY upload_date DESC', ('ТОП-103Б',)),
+    ('следующая страница материалов группы', 'SELECT * FROM materials WHERE group_name = ? AND (upload_date, id) < (?, ?) ORDER BY upload_date DESC, id DESC LIMIT 21',
+     ('ТОП-103Б', '2025-10-28 07:05:01.022805', 3)),
+    ('предметы материалов группы', 'SELECT DISTINCT subject FROM materials WHERE group_name = ?', ('ТОП-103Б',)),
+    ('материалы с файлом (поиск по тексту)', 'SELECT id FROM materials WHERE content_hash = ?', ('0' * 64,)),
+    ('материалы преподавателя', 'SELECT * FROM materials WHERE teacher_name = ? ORDER BY upload_date DESC', ('Кужаев Арсен Фанилевич',)),
+    ('материалы студента', "SELECT * FROM materials WHERE teacher_name = ? AND uploaded_by_role = 'student' ORDER BY upload_date DESC", ('топ103',)),
+    ('пользователь по логину', 'SELECT * FROM users WHERE username = ?', ('admin',)),
+]
+
+
+def current_version(conn):
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def stamp(engine):
+    # Для только что созданной БД: таблицы уже в актуальном виде, остаётся создать представления, поисковые индексы и триггеры
+    with engine.begin() as conn:
+        for statement in VIEWS + SEARCH_SCHEMA + FILE_TEXT_SCHEMA:
+            conn.exec_driver_sql(statement)
+        create_blob_triggers(conn)
+        conn.exec_driver_sql(f'PRAGMA user_version = {MIGRATIONS[-1][0]}')
+
+
+def migrate(engine, verbose=False):
+    with engine.connect() as conn:
+        version = current_version(conn)
+    applied = []
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.exec_driver_sql(statement)
+            conn.exec_driver_sql(f'PRAGMA user_version = {number}')
+        applied.append(number)
+        if verbose:
+            print(f'✅ Миграция {number}: {description}')
+    return applied
+
+
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params).all()]
+
+
+def check_indexes(engine, queries=HOT_QUERIES):
+    # Возвращает [(название, план, ок)]; запрос не ок, если таблица читается полным сканом
+    # или для ORDER BY строится временное B-дерево
+    results = []
+    with engine.connect() as conn:
+        for name, sql, params in queries:
+            plan = explain(conn, sql, params)
+            full_scan = any(step.startswith('SCAN ') and 'INDEX' not in step for step in plan)
+            temp_sort = any('TEMP B-TREE FOR ORDER BY' in step for step in plan)
+            results.append((name, plan, not full_scan and not temp_sort))
+    return results
+
+
+def main():
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'db/university.db'
+    engine = sa.create_engine(f'sqlite:///{db_file}')
+    applied = migrate(engine, verbose=True)
+    with engine.connect() as conn:
+        print(f'📦 Версия схемы: {current_version(conn)}' + ('' if applied else ' (изменений нет)'))
+    failed = 0
+    for name, plan, ok in check_indexes(engine):
+        print(f"{'✅' if ok else '❌'} {name}: {' | '.join(plan)}")
+        failed += not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ from .db_session import SqlAlchemyBase
 
 class Note(SqlAlchemyBase, SerializerMixin):
     __tablename__ = 'notes'
+    __table_args__ = (sqlalchemy.Index('uq_notes_user_group_week_day', 'user_id', 'group_name', 'week_number', 'day_name', unique=True),)
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('users.id'), nullable=False)
@@ -0,0 +1,91 @@
+import re
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+from .lookups import Room
+
+# Занятость аудиторий: одна строка на (аудитория, дата), занятые пары — битовая маска
+# (бит n-1 — пара n). Пересчитывается парсером для затронутых (аудитория, дата) при каждой записи
+
+BUILDING = re.compile(r'Корпус\s*([^\s,]+)')
+_rooms = {'max_id': None, 'rooms': []}
+
+# Маска по каждой (аудитории, дате): внутренний запрос даёт по одной строке на пару, поэтому SUM битов — это OR.
+# Конфликт — в аудитории в одну пару разные занятия (поток нескольких групп — одно занятие)
+OCCUPANCY_SELECT = '''
+SELECT room_id, date, SUM(bit), SUM(CASE WHEN kinds > 1 THEN bit ELSE 0 END) FROM (
+    SELECT l.room_id AS room_id, l.date AS date, 1 << (l.lesson_number - 1) AS bit,
+           COUNT(DISTINCT COALESCE(l.subject_id, 0) || ':' || COALESCE(l.lesson_type_id, 0) || ':' || COALESCE(l.teacher_id, 0)) AS kinds
+    FROM {source} WHERE l.room_id IS NOT NULL AND l.date IS NOT NULL
+    GROUP BY l.room_id, l.date, l.lesson_number)
+GROUP BY room_id, date'''
+# Затронутые пары складываются во временную таблицу; CROSS JOIN закрепляет порядок: по каждой паре — поиск по ix_lessons_room_date
+PAIRS_SOURCE = 'occupancy_pairs p CROSS JOIN lessons l ON l.room_id = p.room_id AND l.date = p.date'
+
+
+class RoomOccupancy(SqlAlchemyBase):
+    __tablename__ = 'room_occupancy'
+    __table_args__ = (sqlalchemy.Index('ix_room_occupancy_date', 'date', 'room_id'),)
+
+    room_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('rooms.id'), primary_key=True)
+    date = sqlalchemy.Column(sqlalchemy.Date, primary_key=True)
+    slots = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)  # занятые пары
+    conflicts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)  # пары с несколькими разными занятиями
+
+    def __repr__(self):
+        return f'<RoomOccupancy {self.room_id} {self.date} {self.slots:09b}>'
+
+
+def slot_mask(slots):
+    mask = 0
+    for slot in slots:
+        mask |= 1 << (int(slot) - 1)
+    return mask
+
+
+def mask_slots(mask):
+    return [bit + 1 for bit in range(mask.bit_length()) if mask >> bit & 1]
+
+
+def room_building(name):
+    match = BUILDING.search(name or '')
+    return match.group(1) if match else None
+
+
+def update_occupancy(conn, pairs=None):
+    # Пересчёт для пар (room_id, дата) — по индексу ix_lessons_room_date; pairs=None — вся таблица.
+    # conn — сессия или соединение внутри транзакции записи
+    if pairs is None:
+        conn.execute(sqlalchemy.text('DELETE FROM room_occupancy'))
+        conn.execute(sqlalchemy.text('INSERT INTO room_occupancy (room_id, date, slots, conflicts) ' + OCCUPANCY_SELECT.format(source='lessons l')))
+        return
+    params = [{'room_id': room_id, 'date': day.isoformat()} for room_id, day in pairs if room_id is not None and day is not None]
+    if not params:
+        return
+    conn.execute(sqlalchemy.text('CREATE TEMP TABLE IF NOT EXISTS occupancy_pairs (room_id INTEGER NOT NULL, date DATE NOT NULL, PRIMARY KEY (room_id, date))'))
+    conn.execute(sqlalchemy.text('DELETE FROM occupancy_pairs'))
+    conn.execute(sqlalchemy.text('INSERT OR IGNORE INTO occupancy_pairs (room_id, date) VALUES (:room_id, :date)'), params)
+    conn.execute(sqlalchemy.text('DELETE FROM room_occupancy WHERE (room_id, date) IN (SELECT room_id, date FROM occupancy_pairs)'))
+    conn.execute(sqlalchemy.text('INSERT INTO room_occupancy (room_id, date, slots, conflicts) ' + OCCUPANCY_SELECT.format(source=PAIRS_SOURCE)))
+
+
+def all_rooms(session):
+    # [(id, название, корпус)] по названию; аудитории только добавляются, поэтому список перечитывается при новом max(id)
+    max_id = session.query(sqlalchemy.func.max(Room.id)).scalar()
+    if _rooms['max_id'] != max_id:
+        _rooms.update(max_id=max_id, rooms=[(room_id, name, room_building(name)) for room_id, name in session.query(Room.id, Room.name).order_by(Room.name).all()])
+    return _rooms['rooms']
+
+
+def free_rooms(session, day, slots, building=None):
+    # Аудитории, свободные во все указанные пары дня: занятые за дату выбираются по ix_room_occupancy_date с проверкой маски в SQLite
+    mask = slot_mask(slots)
+    busy = {room_id for room_id, in session.query(RoomOccupancy.room_id).filter(RoomOccupancy.date == day, RoomOccupancy.slots.op('&')(mask) != 0).all()}
+    return [name for room_id, name, in_building in all_rooms(session) if room_id not in busy and (building is None or in_building == building)]
+
+
+def room_conflicts(session, date_from, date_to):
+    # [(дата, аудитория, [пары])] — аудитории, в которых в одну пару стоят разные занятия
+    q = (session.query(RoomOccupancy.date, Room.name, RoomOccupancy.conflicts).join(Room, Room.id == RoomOccupancy.room_id)
+         .filter(RoomOccupancy.date >= date_from, RoomOccupancy.date <= date_to, RoomOccupancy.conflicts != 0)
+         .order_by(RoomOccupancy.date, Room.name))
+    return [(day, name, mask_slots(conflicts)) for day, name, conflicts in q.all()]
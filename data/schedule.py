@@ -1,25 +1,106 @@
 import datetime
+from collections import Counter
 import sqlalchemy
 from sqlalchemy_serializer import SerializerMixin
-from .db_session import SqlAlchemyBase
+from .db_session import SqlAlchemyBase, ViewBase
+from .lookups import LessonType, Room, StudyGroup, Subject, Teacher, TimeSlot
 
 
-class Schedule(SqlAlchemyBase, SerializerMixin):
-    __tablename__ = 'schedule'
+DAY_NAMES = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота']
+
+
+class Lesson(SqlAlchemyBase):
+    # Нормализованное хранение расписания: справочники вместо строк, настоящая дата
+    __tablename__ = 'lessons'
+    __table_args__ = (sqlalchemy.Index('ix_lessons_group_week_lesson', 'group_id', 'week_number', 'lesson_number'),
+                      sqlalchemy.Index('ix_lessons_group_date', 'group_id', 'date'),
+                      # Расписание преподавателя по всем группам: поддерживается SQLite при каждой записи парсера
+                      sqlalchemy.Index('ix_lessons_teacher_week', 'teacher_id', 'week_number', 'day', 'lesson_number'),
+                      sqlalchemy.Index('ix_lessons_room_date', 'room_id', 'date'),
+                      sqlalchemy.Index('ix_lessons_subject_group', 'subject_id', 'group_id'))
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    group_name = sqlalchemy.Column(sqlalchemy.String, nullable=False)
-    group_id = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    group_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('study_groups.id'), nullable=False)
     week_number = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
-    day_name = sqlalchemy.Column(sqlalchemy.String, nullable=False)  # Понедельник, Вторник и т.д.
-    date = sqlalchemy.Column(sqlalchemy.String)  # Дата в формате DD.MM.YYYY
+    day = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)  # 1 — понедельник ... 6 — суббота
+    date = sqlalchemy.Column(sqlalchemy.Date)
     lesson_number = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    subject_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('subjects.id'))
+    lesson_type_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('lesson_types.id'))
+    teacher_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('teachers.id'))
+    room_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey('rooms.id'))
+    last_updated = sqlalchemy.Column(sqlalchemy.DateTime, default=datetime.datetime.now)
+
+    def __repr__(self):
+        return f'<Lesson {self.group_id} week={self.week_number} day={self.day} Пара {self.lesson_number}>'
+
+
+class Schedule(ViewBase, SerializerMixin):
+    # Только чтение: представление schedule (см. data/migrations.py) собирает прежние
+    # плоские строки из lessons и справочников, поэтому старые запросы работают без изменений
+    __tablename__ = 'schedule'
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    group_name = sqlalchemy.Column(sqlalchemy.String)
+    group_id = sqlalchemy.Column(sqlalchemy.Integer)
+    week_number = sqlalchemy.Column(sqlalchemy.Integer)
+    day_name = sqlalchemy.Column(sqlalchemy.String)  # Понедельник, Вторник и т.д.
+    date = sqlalchemy.Column(sqlalchemy.String)  # Дата в формате DD.MM.YYYY
+    lesson_number = sqlalchemy.Column(sqlalchemy.Integer)
     time_slot = sqlalchemy.Column(sqlalchemy.String)  # Время пары (08:00-09:20)
     subject = sqlalchemy.Column(sqlalchemy.String)  # Название предмета
     lesson_type = sqlalchemy.Column(sqlalchemy.String)  # Лекция, Практика и т.д.
     teacher = sqlalchemy.Column(sqlalchemy.String)  # ФИО преподавателя
     classroom = sqlalchemy.Column(sqlalchemy.String)  # Аудитория
-    last_updated = sqlalchemy.Column(sqlalchemy.DateTime, default=datetime.datetime.now)
+    last_updated = sqlalchemy.Column(sqlalchemy.DateTime)
 
     def __repr__(self):
-        return f'<Schedule {self.group_name} - {self.day_name} - Пара {self.lesson_number}>'
\ No newline at end of file
+        return f'<Schedule {self.group_name} - {self.day_name} - Пара {self.lesson_number}>'
+
+
+def semester_start(session):
+    # Понедельник первой учебной недели, вычисленный по датам занятий (самое частое значение)
+    anchors = Counter()
+    for week_number, day in session.query(Lesson.week_number, sqlalchemy.func.min(Lesson.date)).filter(Lesson.date.is_not(None)).group_by(Lesson.week_number):
+        anchors[day - datetime.timedelta(days=day.weekday(), weeks=week_number - 1)] += 1
+    return anchors.most_common(1)[0][0] if anchors else None
+
+
+def current_week(session, today=None, weeks=18):
+    start = semester_start(session)
+    if start is None:
+        return None
+    today = today or datetime.date.today()
+    return max(1, min(weeks, (today - start).days // 7 + 1))
+
+
+def week_of(start, day, weeks=18):
+    # Номер учебной недели для даты; None — вне семестра
+    week = (day - start).days // 7 + 1 if start else 0
+    return week if 1 <= week <= weeks else None
+
+
+def lesson_rows(session, group_id, weeks=None, date_from=None, date_to=None):
+    # Пары группы со значениями справочников; читаются только строки нужных недель или дат (по индексам lessons)
+    q = (session.query(Lesson.week_number, Lesson.day, Lesson.date, Lesson.lesson_number, TimeSlot.time, Subject.name, LessonType.name, Teacher.name, Room.name)
+         .outerjoin(TimeSlot, TimeSlot.lesson_number == Lesson.lesson_number).outerjoin(Subject, Subject.id == Lesson.subject_id)
+         .outerjoin(LessonType, LessonType.id == Lesson.lesson_type_id).outerjoin(Teacher, Teacher.id == Lesson.teacher_id).outerjoin(Room, Room.id == Lesson.room_id)
+         .filter(Lesson.group_id == group_id))
+    if weeks is not None:
+        q = q.filter(Lesson.week_number.in_(weeks))
+    if date_from is not None:
+        q = q.filter(Lesson.date >= date_from)
+    if date_to is not None:
+        q = q.filter(Lesson.date <= date_to)
+    return q.order_by(Lesson.week_number, Lesson.lesson_number, Lesson.id).all()
+
+
+def teacher_rows(session, teacher_id, weeks=None):
+    # Пары преподавателя во всех группах одним проходом по ix_lessons_teacher_week, уже в порядке недель, дней и пар
+    q = (session.query(Lesson.week_number, Lesson.day, Lesson.date, Lesson.lesson_number, TimeSlot.time, Subject.name, LessonType.name, Room.name, StudyGroup.name)
+         .join(StudyGroup, StudyGroup.id == Lesson.group_id).outerjoin(TimeSlot, TimeSlot.lesson_number == Lesson.lesson_number)
+         .outerjoin(Subject, Subject.id == Lesson.subject_id).outerjoin(LessonType, LessonType.id == Lesson.lesson_type_id).outerjoin(Room, Room.id == Lesson.room_id)
+         .filter(Lesson.teacher_id == teacher_id))
+    if weeks is not None:
+        q = q.filter(Lesson.week_number.in_(weeks))
+    return q.order_by(Lesson.week_number, Lesson.day, Lesson.lesson_number).all()
@@ -0,0 +1,123 @@
+import re
+import sqlalchemy
+
+# Полнотекстовый поиск (SQLite FTS5): названия предметов, преподавателей и аудиторий из справочников
+# и материалы (название, описание, предмет). Индексы поддерживаются триггерами, поэтому записи парсера
+# и загрузки попадают в поиск без отдельного кода. unicode61 приводит кириллицу к нижнему регистру;
+# «ё» заменяется на «е» и в индексе, и в запросе
+
+TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2'"
+TOKEN = re.compile(r'[^\W_]+')
+KINDS = {'subject': 'предмет', 'teacher': 'преподаватель', 'room': 'аудитория'}
+
+
+def yo(expr):
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def material_values(row):
+    description = f"COALESCE({row}description, '')"
+    return f"{yo(row + 'title')}, {yo(description)}, {yo(row + 'subject')}"
+
+
+SCHEDULE_SOURCES = [('subject', 'subjects'), ('teacher', 'teachers'), ('room', 'rooms')]
+
+# Выполняется миграцией 7 и при создании новой БД (migrations.stamp); всё идемпотентно
+SEARCH_SCHEMA = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS schedule_fts USING fts5(name, kind UNINDEXED, ref_id UNINDEXED, {TOKENIZE})',
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS materials_fts USING fts5(title, description, subject, {TOKENIZE})',
+] + [
+    # Справочники только пополняются: строки не меняются и не удаляются
+    f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN "
+    f"INSERT INTO schedule_fts (name, kind, ref_id) VALUES ({yo('new.name')}, '{kind}', new.id); END"
+    for kind, table in SCHEDULE_SOURCES
+] + [
+    # rowid в materials_fts — id материала
+    f"CREATE TRIGGER IF NOT EXISTS materials_fts_insert AFTER INSERT ON materials BEGIN "
+    f"INSERT INTO materials_fts (rowid, title, description, subject) VALUES (new.id, {material_values('new.')}); END",
+    'CREATE TRIGGER IF NOT EXISTS materials_fts_delete AFTER DELETE ON materials BEGIN DELETE FROM materials_fts WHERE rowid = old.id; END',
+    f"CREATE TRIGGER IF NOT EXISTS materials_fts_update AFTER UPDATE OF title, description, subject ON materials BEGIN "
+    f"DELETE FROM materials_fts WHERE rowid = old.id; "
+    f"INSERT INTO materials_fts (rowid, title, description, subject) VALUES (new.id, {material_values('new.')}); END",
+]
+
+# Текст самих файлов (text_index.py) — по строке на содержимое (blobs.sha256), общей для всех материалов с этим файлом.
+# Выполняется миграцией 11 и при создании новой БД
+FILE_TEXT_SCHEMA = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS file_text_fts USING fts5(body, sha256 UNINDEXED, {TOKENIZE})',
+    'CREATE TRIGGER IF NOT EXISTS blobs_text_delete AFTER DELETE ON blobs BEGIN DELETE FROM file_text_fts WHERE sha256 = old.sha256; END',
+]
+
+# Заполнение индексов по уже существующим строкам (миграция 7)
+SEARCH_FILL = [
+    'DELETE FROM schedule_fts',
+    'DELETE FROM materials_fts',
+] + [
+    f"INSERT INTO schedule_fts (name, kind, ref_id) SELECT {yo('name')}, '{kind}', id FROM {table}" for kind, table in SCHEDULE_SOURCES
+] + [
+    f"INSERT INTO materials_fts (rowid, title, description, subject) SELECT id, {material_values('')} FROM materials",
+]
+
+# Столбец lessons, по которому значение справочника связано с расписанием; по каждому есть индекс
+LESSON_COLUMNS = {'subject': 'subject_id', 'teacher': 'teacher_id', 'room': 'room_id'}
+
+# Фильтр по группе внутри запроса к schedule_fts, до LIMIT: для каждого вида — свой EXISTS по индексу lessons
+IN_GROUP = 'CASE kind ' + ' '.join(
+    f"WHEN '{kind}' THEN EXISTS (SELECT 1 FROM lessons l JOIN study_groups g ON g.id = l.group_id WHERE l.{column} = ref_id AND g.name = :group_name)"
+    for kind, column in LESSON_COLUMNS.items()) + ' END'
+
+
+def fts_query(text):
+    # Каждое слово — префикс, все слова обязательны; кавычки не дают пользователю писать операторы FTS5
+    tokens = TOKEN.findall((text or '').replace('ё', 'е').replace('Ё', 'Е'))
+    return ' '.join(f'"{token}"*' for token in tokens) or None
+
+
+def search_schedule(session, text, limit=20, group_name=None):
+    # [{'тип', 'название', 'группы'}] по релевантности; group_name — только то, что есть в расписании группы
+    query = fts_query(text)
+    if not query:
+        return []
+    sql = 'SELECT kind, ref_id FROM schedule_fts WHERE schedule_fts MATCH :q'
+    params = {'q': query, 'limit': limit}
+    if group_name:
+        sql += f' AND {IN_GROUP}'
+        params['group_name'] = group_name
+    matches = session.execute(sqlalchemy.text(sql + ' ORDER BY rank LIMIT :limit'), params).all()
+    names, groups, parts = {}, {}, []
+    for kind, table in SCHEDULE_SOURCES:
+        ids = ', '.join(str(int(ref_id)) for match_kind, ref_id in matches if match_kind == kind)
+        if ids:
+            names.update({(kind, ref_id): name for ref_id, name in session.execute(sqlalchemy.text(f'SELECT id, name FROM {table} WHERE id IN ({ids})')).all()})
+            parts.append(f"SELECT DISTINCT '{kind}', l.{LESSON_COLUMNS[kind]}, g.name FROM lessons l JOIN study_groups g ON g.id = l.group_id WHERE l.{LESSON_COLUMNS[kind]} IN ({ids})")
+    # Группы всех найденных значений — одним запросом
+    if parts:
+        for kind, ref_id, name in session.execute(sqlalchemy.text(' UNION '.join(parts) + ' ORDER BY 3')).all():
+            groups.setdefault((kind, ref_id), []).append(name)
+    return [{'тип': KINDS[kind], 'название': names.get((kind, ref_id)), 'группы': groups.get((kind, ref_id), [])} for kind, ref_id in matches]
+
+
+def search_material_ids(session, text, limit=None, group_name=None, teacher_name=None):
+    # id материалов по релевантности: сначала совпадения в названии, описании и предмете, затем — в тексте файла.
+    # Фильтры по группе и преподавателю применяются в том же запросе
+    query = fts_query(text)
+    if not query:
+        return []
+    sql = '''SELECT m.id FROM (
+                 SELECT rowid AS id, 0 AS source, rank FROM materials_fts WHERE materials_fts MATCH :q
+                 UNION ALL
+                 SELECT fm.id, 1, file_text_fts.rank FROM file_text_fts JOIN materials fm ON fm.content_hash = file_text_fts.sha256
+                 WHERE file_text_fts MATCH :q) hits
+             JOIN materials m ON m.id = hits.id WHERE 1'''
+    params = {'q': query}
+    if group_name:
+        sql += ' AND m.group_name = :group_name'
+        params['group_name'] = group_name
+    if teacher_name:
+        sql += ' AND m.teacher_name = :teacher_name'
+        params['teacher_name'] = teacher_name
+    sql += ' GROUP BY m.id ORDER BY MIN(hits.source), MIN(hits.rank)'
+    if limit:
+        sql += ' LIMIT :limit'
+        params['limit'] = limit
+    return [material_id for material_id, in session.execute(sqlalchemy.text(sql), params).all()]
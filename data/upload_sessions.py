@@ -0,0 +1,50 @@
+import os
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+
+# Загрузка файла частями: клиент открывает сессию с заявленным размером, шлёт части по номеру
+# (все, кроме последней, ровно chunk_size байт), после обрыва узнаёт received и продолжает с нужной части.
+# Части дописываются во временный файл <папка загрузок>/tmp/<id>.part
+
+COPY_BLOCK = 64 * 1024  # байт; столько держится в памяти при записи части
+
+
+class UploadSession(SqlAlchemyBase):
+    __tablename__ = 'upload_sessions'
+    __table_args__ = (sqlalchemy.Index('ix_upload_sessions_updated', 'updated_at'),)
+
+    id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)  # случайный токен
+    user_id = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    filename = sqlalchemy.Column(sqlalchemy.String, nullable=False)
+    size = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)  # заявленный размер файла, байт
+    chunk_size = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    received = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)  # байт, принятых подряд с начала файла
+    created_at = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.func.now())
+    updated_at = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.func.now())
+
+    def state(self):
+        return {'id': self.id, 'size': self.size, 'chunk_size': self.chunk_size, 'received': self.received,
+                'next_chunk': self.received // self.chunk_size, 'complete': self.received == self.size}
+
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.received}/{self.size}>'
+
+
+def part_path(root, upload_id):
+    return os.path.join(root, 'tmp', f'{upload_id}.part')
+
+
+def write_chunk(path, offset, stream, length):
+    # Пишет часть с позиции offset блоками по COPY_BLOCK; больше length байт не читает.
+    # Возвращает число записанных байт (меньше length — клиент оборвал передачу)
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(COPY_BLOCK, length - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+        f.truncate()
+    return written
@@ -0,0 +1,18 @@
+import datetime
+import sqlalchemy
+from .db_session import SqlAlchemyBase
+
+
+class WeekFingerprint(SqlAlchemyBase):
+    __tablename__ = 'week_fingerprints'
+    __table_args__ = (sqlalchemy.UniqueConstraint('group_id', 'week_number'),)
+
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
+    group_id = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    week_number = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    fingerprint = sqlalchemy.Column(sqlalchemy.String(40), nullable=False)  # sha1 нормализованной недели
+    checked_at = sqlalchemy.Column(sqlalchemy.DateTime, default=datetime.datetime.now)  # последняя проверка
+    changed_at = sqlalchemy.Column(sqlalchemy.DateTime, default=datetime.datetime.now)  # последнее изменение
+
+    def __repr__(self):
+        return f'<WeekFingerprint {self.group_id} week={self.week_number} {self.fingerprint[:8]}>'
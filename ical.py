@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+# Ленты iCalendar (RFC 5545) из расписания. Время пар — местное время УУНиТ (Уфа, UTC+5, без перехода на летнее)
+
+TZID = 'Asia/Yekaterinburg'
+VTIMEZONE = ['BEGIN:VTIMEZONE', f'TZID:{TZID}', 'BEGIN:STANDARD', 'DTSTART:19700101T000000',
+             'TZOFFSETFROM:+0500', 'TZOFFSETTO:+0500', 'TZNAME:+05', 'END:STANDARD', 'END:VTIMEZONE']
+CHUNK_EVENTS = 50  # событий в одном куске потокового ответа
+
+
+def escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+    # Строки длиннее 75 октетов переносятся с пробелом в начале продолжения, не разрывая символы UTF-8
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts, current, size = [], '', 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def event_lines(uid, day, lesson, stamp):
+    start, _, end = (lesson['время'] or '').partition('-')
+    if not start or not end:
+        return []
+    summary = f"{lesson['предмет']} ({lesson['тип']})" if lesson.get('тип') else lesson['предмет']
+    description = []
+    if lesson.get('преподаватель'):
+        description.append(f"Преподаватель: {lesson['преподаватель']}")
+    if lesson.get('группы'):
+        description.append(f"Группы: {', '.join(lesson['группы'])}")
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{stamp}',
+             f"DTSTART;TZID={TZID}:{day:%Y%m%d}T{start.replace(':', '')}00", f"DTEND;TZID={TZID}:{day:%Y%m%d}T{end.replace(':', '')}00",
+             f'SUMMARY:{escape(summary)}']
+    if lesson.get('аудитория'):
+        lines.append(f"LOCATION:{escape(lesson['аудитория'])}")
+    if description:
+        lines.append(f"DESCRIPTION:{escape(chr(10).join(description))}")
+    lines.append('END:VEVENT')
+    return lines
+
+
+def calendar_chunks(name, uid_prefix, days, last_modified=None):
+    # days — [(дата 'ДД.ММ.ГГГГ', [пары])]; отдаёт ленту кусками в байтах для потокового ответа
+    stamp = (last_modified or datetime.now(timezone.utc)).strftime('%Y%m%dT%H%M%SZ')
+    head = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//UUST//Schedule//RU', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+            f'X-WR-CALNAME:{escape(name)}', f'X-WR-TIMEZONE:{TZID}', 'REFRESH-INTERVAL;VALUE=DURATION:PT1H'] + VTIMEZONE
+    yield ''.join(fold(line) for line in head).encode('utf-8')
+    chunk, count = [], 0
+    for day_text, lessons in days:
+        try:
+            day = datetime.strptime(day_text, '%d.%m.%Y').date()
+        except ValueError:
+            continue
+        slots = {}
+        for lesson in lessons:
+            ordinal = slots[lesson['номер_пары']] = slots.get(lesson['номер_пары'], -1) + 1
+            chunk.extend(fold(line) for line in event_lines(f"{uid_prefix}-{day:%Y%m%d}-{lesson['номер_пары']}-{ordinal}@schedule.uust.ru", day, lesson, stamp))
+            count += 1
+        if count >= CHUNK_EVENTS:
+            yield ''.join(chunk).encode('utf-8')
+            chunk, count = [], 0
+    chunk.append(fold('END:VCALENDAR'))
+    yield ''.join(chunk).encode('utf-8')
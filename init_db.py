@@ -1,9 +1,12 @@
 import os
 from data import db_session
 from data.users import User
-from data.schedule import Schedule
+from data.schedule import Schedule, Lesson
 from data.notes import Note
 from data.materials import Material
+from data.week_fingerprints import WeekFingerprint
+from data.crawl_tasks import CrawlTask
+from data.lookups import StudyGroup, Subject, Teacher, Room, LessonType, TimeSlot
 
 def create_database():
     if not os.path.exists('db'):
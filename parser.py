@@ -1,15 +1,82 @@
 import requests
+import sqlalchemy as sa
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+import argparse
+import gzip
+import hashlib
+import html
 import json
+import os
+import random
 import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from collections import OrderedDict
+from collections import Counter, OrderedDict
+from html.entities import html5 as html5_entities
+from urllib.parse import urlsplit
+import crawl_queue
 from data import db_session
-from data.schedule import Schedule
+from data.lookups import LOOKUPS, StudyGroup, TimeSlot, refresh_group_stats
+from data.rooms import update_occupancy
+from data.schedule import DAY_NAMES, Lesson
+from data.week_fingerprints import WeekFingerprint
+
+ISU_URL = "https://isu.uust.ru/module/schedule/schedule_2024_script.php"
+
+CELL_TAG = re.compile(r'</?[a-zA-Z][^<>]*>')
+# Комментарии, script/style и т.п., а также сущности без ';' — разбираем через BeautifulSoup
+CELL_UNSUPPORTED = re.compile(r'<[!?]|<(?:script|style|textarea|title)\b|&(?![a-zA-Z][a-zA-Z0-9]*;|#[0-9]+;|#[xX][0-9a-fA-F]+;)', re.I)
+CELL_ENTITY = re.compile(r'&([a-zA-Z][a-zA-Z0-9]*);')
+ARCHIVE_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+ARCHIVE_NAME = re.compile(r'(\d+)_(\d{8}T\d{12})\.html\.gz$')
+SUBJECT_LINE = re.compile(r'(.+?)\s*\((.+?)\)')
+
+
+class FetchError(Exception):
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts  # сколько запросов сделано до отказа
+
+
+class HostRateLimiter:
+    # Не чаще rate запросов в секунду на один хост (общий для всех потоков)
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 
 class ScheduleParser:
-    def __init__(self):
-        self.base_url = "https://isu.uust.ru/module/schedule/schedule_2024_script.php"
+    def __init__(self, workers=1, rate_limit=None, retries=3, backoff=0.5, base_url=ISU_URL, force=False, archive_dir=None):
+        self.base_url = base_url
+        self.force = force  # перезаписывать недели, даже если отпечаток не изменился
+        self.archive_dir = archive_dir  # куда складывать сырые ответы ИСУ (None — не сохранять)
+        self.lookup_cache = {}  # {таблица справочника: {название: id}}
+        self.time_slots_saved = False
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = HostRateLimiter(rate_limit)
+        # Одна сессия на весь парсер: keep-alive и пул соединений на каждый поток-воркер
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.http.mount('http://', adapter)
+        self.http.mount('https://', adapter)
         self.headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:144.0) Gecko/20100101 Firefox/144.0', 'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8', 'X-Requested-With': 'XMLHttpRequest'}
         self.time_slots = {'1': '08:00-09:20', '2': '09:35-10:55', '3': '11:35-12:55', '4': '13:10-14:30', '5': '15:10-16:30', '6': '16:45-18:05', '7': '18:20-19:40', '8': '19:55-21:15', '9': '21:25-22:45'}
         self.weekdays = {'1': 'Понедельник', '2': 'Вторник', '3': 'Среда', '4': 'Четверг', '5': 'Пятница', '6': 'Суббота'}
@@ -23,48 +90,81 @@ class ScheduleParser:
             dates[day_name] = date_str
         return dates
     
-    def parse_week(self, group_id, week_number):
+    def fetch_week(self, group_id, week_number):
         data = {'week': str(week_number), 'group_id': str(group_id), 'funct': 'group', 'show_temp': '0'}
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 2))
+            self.rate_limiter.wait(self.base_url)
+            try:
+                response = self.http.post(self.base_url, data=data, headers=self.headers, timeout=10)
+                if response.status_code == 429 or response.status_code >= 500:
+                    last_error = f'HTTP {response.status_code}'
+                    continue
+                response.raise_for_status()
+                if self.archive_dir:
+                    self.archive_response(group_id, week_number, response.text)
+                return response.text, attempt + 1
+            except requests.HTTPError as e:
+                raise FetchError(str(e), attempt + 1)
+            except requests.RequestException as e:
+                last_error = str(e)
+        raise FetchError(f'{last_error} (попыток: {self.retries + 1})', self.retries + 1)
+
+    def parse_week_html(self, html_content):
+        dates = self.extract_dates_from_html(html_content)
+        ss = re.findall(r"\$\('#(\d+_\d+_group)'\)\.append\('(.+?)'\);", html_content)
+        ws = OrderedDict()
+        for day_name in self.weekdays_order:
+            ws[day_name] = {'дата': dates.get(day_name, ''), 'пары': []}
+        for cell_id, content in ss:
+            match = re.match(r'(\d+)_(\d+)_group', cell_id)
+            if match:
+                lesson_number = match.group(1)
+                day_number = match.group(2)
+                li = self.parse_lesson_content(content)
+                if li:
+                    day_name = self.weekdays.get(day_number, f'День {day_number}')
+                    if day_name in ws:
+                        ws[day_name]['пары'].append({'номер_пары': int(lesson_number), 'время': self.time_slots.get(lesson_number, ''), **li})
+        for day in ws:
+            ws[day]['пары'] = sorted(ws[day]['пары'], key=lambda x: x['номер_пары'])
+        ws_filtered = OrderedDict()
+        for day, data in ws.items():
+            if data['пары']:
+                ws_filtered[day] = data
+        return ws_filtered
+
+    def parse_week(self, group_id, week_number):
         try:
-            response = requests.post(self.base_url, data=data, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            html_content = response.text
-            dates = self.extract_dates_from_html(html_content)
-            ss = re.findall(r"\$\('#(\d+_\d+_group)'\)\.append\('(.+?)'\);", html_content)
-            ws = OrderedDict()
-            for day_name in self.weekdays_order:
-                ws[day_name] = {'дата': dates.get(day_name, ''), 'пары': []}
-            for cell_id, content in ss:
-                match = re.match(r'(\d+)_(\d+)_group', cell_id)
-                if match:
-                    lesson_number = match.group(1)
-                    day_number = match.group(2)
-                    li = self.parse_lesson_content(content)
-                    if li:
-                        day_name = self.weekdays.get(day_number, f'День {day_number}')
-                        if day_name in ws:
-                            ws[day_name]['пары'].append({'номер_пары': int(lesson_number), 'время': self.time_slots.get(lesson_number, ''), **li})
-            for day in ws:
-                ws[day]['пары'] = sorted(ws[day]['пары'], key=lambda x: x['номер_пары'])
-            ws_filtered = OrderedDict()
-            for day, data in ws.items():
-                if data['пары']:
-                    ws_filtered[day] = data
-            return ws_filtered
+            html_content, _ = self.fetch_week(group_id, week_number)
+            return self.parse_week_html(html_content)
         except Exception as e:
             return {}
-    
+
+    def cell_text(self, content):
+        # Быстрый путь для простой разметки ячейки (теги без вложенных '<'/'>' и обычные сущности):
+        # тот же результат, что и BeautifulSoup(...).get_text('|', strip=True), но без построения дерева
+        if not CELL_UNSUPPORTED.search(content) and all(name + ';' in html5_entities for name in CELL_ENTITY.findall(content)):
+            chunks = CELL_TAG.split(content)
+            if not any('<' in chunk or '>' in chunk for chunk in chunks):
+                if '&' in content:
+                    chunks = [html.unescape(chunk) for chunk in chunks]
+                return '|'.join(t for t in (chunk.strip() for chunk in chunks) if t)
+        soup = BeautifulSoup(f'<div>{content}</div>', 'html.parser')
+        return soup.get_text(separator='|', strip=True)
+
     def parse_lesson_content(self, content):
         try:
             content = content.replace('\\/', '/')
             content = content.replace("\\'", "'")
-            soup = BeautifulSoup(f'<div>{content}</div>', 'html.parser')
-            text = soup.get_text(separator='|', strip=True)
+            text = self.cell_text(content)
             parts = [p.strip() for p in text.split('|') if p.strip()]
             if len(parts) < 1:
                 return None
             subject_line = parts[0]
-            match = re.match(r'(.+?)\s*\((.+?)\)', subject_line)
+            match = SUBJECT_LINE.match(subject_line)
             if match:
                 subject = match.group(1).strip()
                 lesson_type = match.group(2).strip()
@@ -82,34 +182,264 @@ class ScheduleParser:
         except Exception as e:
             return None
     
-    def save_to_database(self, group_id, group_name, week_number, week_data):
+    def week_fingerprint(self, group_name, week_data):
+        # Хэш разобранной недели, а не сырого HTML: в ответе ИСУ бывают меняющиеся мелочи
+        normalized = json.dumps([group_name, week_data], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    def week_rows(self, week_data):
+        # Строки недели с порядковым номером внутри слота: в одной паре бывает несколько
+        # записей (подгруппы), поэтому естественный ключ — (день, пара, порядковый номер).
+        # Значения справочников пока строками, id подставляет save_weeks
+        rows, seen = {}, Counter()
+        for day_name, day_data in week_data.items():
+            if day_name not in DAY_NAMES:
+                continue
+            day = DAY_NAMES.index(day_name) + 1
+            try:
+                date = datetime.strptime(day_data.get('дата', ''), '%d.%m.%Y').date()
+            except ValueError:
+                date = None
+            for lesson in day_data['пары']:
+                slot = (day, lesson['номер_пары'])
+                rows[slot + (seen[slot],)] = {'day': day, 'date': date, 'lesson_number': lesson['номер_пары'], 'subject': lesson['предмет'], 'lesson_type': lesson['тип'], 'teacher': lesson['преподаватель'], 'classroom': lesson['аудитория']}
+                seen[slot] += 1
+        return rows
+
+    def lookup_ids(self, s, model, names):
+        # id значений справочника; недостающие добавляются. Кэш живёт всё время работы парсера:
+        # строки справочников не удаляются и не меняют id
+        cache = self.lookup_cache.setdefault(model.__tablename__, {})
+        missing = [name for name in names if name is not None and name not in cache]
+        if missing:
+            table = model.__table__
+            s.execute(sqlite_insert(table).on_conflict_do_nothing(index_elements=['name']), [{'name': name} for name in missing])
+            cache.update(s.execute(sa.select(table.c.name, table.c.id).where(table.c.name.in_(missing))).all())
+        return cache
+
+    def save_weeks(self, group_id, group_name, weeks):
+        # Пишет несколько недель группы одной транзакцией: пропускает недели с прежним отпечатком,
+        # для остальных считает разницу со строками в БД и применяет её через executemany.
+        # Возвращает {неделя: 'new' / 'updated' / 'unchanged'} или None при ошибке
+        lessons, fingerprints = Lesson.__table__, WeekFingerprint.__table__
+        prints = {week: self.week_fingerprint(group_name, data) for week, data in weeks.items()}
+        s = db_session.create_session()
         try:
-            s = db_session.create_session()
-            s.query(Schedule).filter(Schedule.group_id == group_id, Schedule.week_number == week_number).delete()
-            for day_name, day_data in week_data.items():
-                date_str = day_data.get('дата', '')
-                for lesson in day_data['пары']:
-                    schedule_entry = Schedule(group_name=group_name, group_id=group_id, week_number=week_number, day_name=day_name, date=date_str, lesson_number=lesson['номер_пары'], time_slot=lesson['время'], subject=lesson['предмет'], lesson_type=lesson['тип'], teacher=lesson['преподаватель'], classroom=lesson['аудитория'], last_updated=datetime.now())
-                    s.add(schedule_entry)
+            now = datetime.now()
+            stored = dict(s.execute(sa.select(fingerprints.c.week_number, fingerprints.c.fingerprint).where(fingerprints.c.group_id == group_id, fingerprints.c.week_number.in_(list(weeks)))).all())
+            changed = [week for week in weeks if self.force or stored.get(week) != prints[week]]
+            statuses = {week: 'unchanged' for week in weeks}
+            existing, seen = {}, Counter()
+            if changed:
+                upsert = sqlite_insert(StudyGroup.__table__)
+                s.execute(upsert.on_conflict_do_update(index_elements=['id'], set_={'name': upsert.excluded.name}), {'id': group_id, 'name': group_name})
+                if not self.time_slots_saved:
+                    s.execute(sqlite_insert(TimeSlot.__table__).on_conflict_do_nothing(), [{'lesson_number': int(number), 'time': time_slot} for number, time_slot in self.time_slots.items()])
+                    self.time_slots_saved = True
+                q = sa.select(lessons).where(lessons.c.group_id == group_id, lessons.c.week_number.in_(changed)).order_by(lessons.c.week_number, lessons.c.id)
+                for row in s.execute(q).mappings():
+                    slot = (row['week_number'], row['day'], row['lesson_number'])
+                    existing[slot + (seen[slot],)] = row
+                    seen[slot] += 1
+            week_rows = {week: self.week_rows(weeks[week]) for week in changed}
+            ids = {column: self.lookup_ids(s, model, {row[column] for rows in week_rows.values() for row in rows.values()}) for column, model in LOOKUPS.items()}
+            inserts, updates, deletes = [], [], []
+            rooms = set()  # (room_id, дата), у которых меняется занятость
+            for week in changed:
+                had_rows = any(key[0] == week for key in existing)
+                week_changed = False
+                for key, row in week_rows[week].items():
+                    values = {'group_id': group_id, 'week_number': week, 'day': row['day'], 'date': row['date'], 'lesson_number': row['lesson_number'],
+                              'subject_id': ids['subject'].get(row['subject']), 'lesson_type_id': ids['lesson_type'].get(row['lesson_type']),
+                              'teacher_id': ids['teacher'].get(row['teacher']), 'room_id': ids['classroom'].get(row['classroom'])}
+                    old = existing.pop((week,) + key, None)
+                    if old is None:
+                        inserts.append({**values, 'last_updated': now})
+                        rooms.add((values['room_id'], values['date']))
+                        week_changed = True
+                    elif any(old[column] != value for column, value in values.items()):
+                        updates.append({**values, 'row_id': old['id'], 'last_updated': now})
+                        rooms.update([(old['room_id'], old['date']), (values['room_id'], values['date'])])
+                        week_changed = True
+                gone = [row for key, row in existing.items() if key[0] == week]
+                deletes.extend(row['id'] for row in gone)
+                rooms.update((row['room_id'], row['date']) for row in gone)
+                if week_changed or gone:
+                    statuses[week] = 'updated' if had_rows else 'new'
+            if inserts:
+                s.execute(lessons.insert(), inserts)
+            if updates:
+                s.execute(lessons.update().where(lessons.c.id == sa.bindparam('row_id')), updates)
+            if deletes:
+                s.execute(lessons.delete().where(lessons.c.id.in_(deletes)))
+            update_occupancy(s, rooms)
+            upsert = sqlite_insert(fingerprints)
+            s.execute(upsert.on_conflict_do_update(index_elements=['group_id', 'week_number'], set_={'fingerprint': upsert.excluded.fingerprint, 'checked_at': upsert.excluded.checked_at}),
+                      [{'group_id': group_id, 'week_number': week, 'fingerprint': prints[week], 'checked_at': now, 'changed_at': now} for week in weeks])
+            touched = [week for week, status in statuses.items() if status != 'unchanged']
+            groups = StudyGroup.__table__
+            if touched:
+                s.execute(fingerprints.update().where(fingerprints.c.group_id == group_id, fingerprints.c.week_number.in_(touched)).values(changed_at=now))
+                # Новая версия группы сбрасывает кэши расписания во всех процессах веб-приложения
+                s.execute(groups.update().where(groups.c.id == group_id).values(version=groups.c.version + 1))
+                refresh_group_stats(s, group_id, now)
+            else:
+                s.execute(groups.update().where(groups.c.id == group_id).values(refreshed_at=now))
             s.commit()
-            return True
+            return statuses
         except Exception as e:
             s.rollback()
-            return False
+            self.lookup_cache.clear()
+            return None
         finally:
             s.close()
-    
+
+    def save_to_database(self, group_id, group_name, week_number, week_data):
+        # Возвращает 'new' / 'updated' / 'unchanged', или None при ошибке
+        statuses = self.save_weeks(group_id, group_name, {week_number: week_data})
+        return statuses[week_number] if statuses else None
+
+    def archive_response(self, group_id, week_number, html_content):
+        folder = os.path.join(self.archive_dir, str(group_id))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{week_number:02d}_{datetime.now().strftime(ARCHIVE_TIME_FORMAT)}.html.gz')
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            f.write(html_content)
+        os.replace(path + '.tmp', path)
+        return path
+
+    def parse_result(self, result, html_content):
+        try:
+            result['data'] = self.parse_week_html(html_content)
+            result['lessons'] = sum(len(day['пары']) for day in result['data'].values())
+            if not result['data']:
+                # Пустая неделя — только если это страница расписания (есть заголовки дней). Страница техработ, входа
+                # или ошибки с кодом 200 — сбой: иначе запись пустой недели стёрла бы её пары
+                if self.extract_dates_from_html(html_content):
+                    result['status'] = 'empty'
+                else:
+                    result['status'], result['data'] = 'failed', None
+                    result['error'] = 'ответ не похож на страницу расписания'
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = f'ошибка разбора: {e}'
+        return result
+
+    def crawl_week(self, group_id, week_number):
+        result = {'group_id': group_id, 'week': week_number, 'status': 'ok', 'lessons': 0, 'attempts': 0, 'error': None, 'write': None, 'data': None}
+        try:
+            html_content, result['attempts'] = self.fetch_week(group_id, week_number)
+        except FetchError as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+            result['attempts'] = e.attempts
+            return result
+        return self.parse_result(result, html_content)
+
+    def write_group(self, group_id, group_name, results, save=True):
+        # Пустая, но успешно разобранная неделя тоже пишется: её прежние пары удаляются. Ошибки загрузки и разбора не трогают БД
+        ok = [r for r in results if r['status'] in ('ok', 'empty')]
+        if save and ok:
+            statuses = self.save_weeks(group_id, group_name, {r['week']: r['data'] or {} for r in ok})
+            for r in ok:
+                r['write'] = statuses[r['week']] if statuses else None
+                if not statuses:
+                    r['status'] = 'save_failed'
+        for r in results:
+            r['group_name'] = group_name
+            r['data'] = None
+        return results
+
+    def collect(self, futures, groups, expected, save=True):
+        # Запись в БД — в вызывающем потоке, одной транзакцией на группу, как только
+        # готовы все её недели: SQLite не получает параллельных писателей
+        names = {group['id']: group['name'] for group in groups}
+        pending = {group['id']: [] for group in groups}
+        report = []
+        for future in as_completed(futures):
+            result = future.result()
+            results = pending[result['group_id']]
+            results.append(result)
+            if len(results) == expected[result['group_id']]:
+                report.extend(self.write_group(result['group_id'], names[result['group_id']], results, save))
+        report.sort(key=lambda r: (r['group_name'], r['week']))
+        return report
+
+    def crawl_tasks(self, tasks, save=True):
+        # tasks — список (group_id, group_name, week_number); сеть и разбор — в пуле потоков
+        groups = list({group_id: {'id': group_id, 'name': group_name} for group_id, group_name, _ in tasks}.values())
+        expected = Counter(group_id for group_id, _, _ in tasks)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self.crawl_week, group_id, week) for group_id, _, week in tasks]
+            return self.collect(futures, groups, expected, save)
+
+    def crawl(self, groups, start_week=1, end_week=18, save=True):
+        return self.crawl_tasks([(group['id'], group['name'], week) for group in groups for week in range(start_week, end_week + 1)], save)
+
+    def replay(self, groups, start_week=1, end_week=18, processes=None, save=True):
+        # Повторный разбор сохранённых ответов без сети: последний ответ на (группу, неделю),
+        # разбор — в пуле процессов
+        tasks = []
+        for group in groups:
+            for week, path in sorted(find_archived(self.archive_dir, group['id']).items()):
+                if start_week <= week <= end_week:
+                    tasks.append((group['id'], week, path))
+        expected = Counter(group_id for group_id, _, _ in tasks)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(replay_week, group_id, week, path) for group_id, week, path in tasks]
+            return self.collect(futures, [group for group in groups if expected[group['id']]], expected, save)
+
     def parse_semester(self, group_id, group_name, start_week=1, end_week=18):
-        successful_weeks = 0
-        total_lessons = 0
-        for week in range(start_week, end_week + 1):
-            week_data = self.parse_week(group_id, week)
-            if week_data:
-                if self.save_to_database(group_id, group_name, week, week_data):
-                    lessons_in_week = sum(len(day['пары']) for day in week_data.values())
-                    total_lessons += lessons_in_week
-                    successful_weeks += 1
-        return successful_weeks > 0
+        report = self.crawl([{'id': group_id, 'name': group_name}], start_week, end_week)
+        return any(r['status'] == 'ok' for r in report)
+
+    def close(self):
+        self.http.close()
+
+
+def find_archived(archive_dir, group_id):
+    # {неделя: путь к самому свежему ответу}
+    latest = {}
+    folder = os.path.join(archive_dir, str(group_id))
+    if not os.path.isdir(folder):
+        return latest
+    for name in sorted(os.listdir(folder)):
+        match = ARCHIVE_NAME.match(name)
+        if match:
+            latest[int(match.group(1))] = os.path.join(folder, name)
+    return latest
+
+
+def replay_week(group_id, week_number, path):
+    # Выполняется в процессе пула, поэтому функция модульного уровня
+    global _replay_parser
+    if _replay_parser is None:
+        _replay_parser = ScheduleParser()
+    result = {'group_id': group_id, 'week': week_number, 'status': 'ok', 'lessons': 0, 'attempts': 0, 'error': None, 'write': None, 'data': None}
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            html_content = f.read()
+    except OSError as e:
+        result['status'] = 'failed'
+        result['error'] = f'архив не читается: {e}'
+        return result
+    return _replay_parser.parse_result(result, html_content)
+
+
+_replay_parser = None
+
+
+def summarize_report(report):
+    summary = OrderedDict()
+    for r in report:
+        g = summary.setdefault(r['group_name'], {'ok': 0, 'empty': 0, 'failed': 0, 'save_failed': 0, 'new': 0, 'updated': 0, 'unchanged': 0, 'lessons': 0, 'errors': []})
+        g[r['status']] += 1
+        if r['write']:
+            g[r['write']] += 1
+        g['lessons'] += r['lessons'] if r['status'] == 'ok' else 0
+        if r['error']:
+            g['errors'].append(f"неделя {r['week']}: {r['error']}")
+    return summary
 
 
 def load_groups(filename='groups.json'):
@@ -127,15 +457,65 @@ def load_groups(filename='groups.json'):
 
 
 def main():
-    db_session.global_init('db/university.db')
-    parser = ScheduleParser()
-    groups = load_groups('groups.json')
-    print("🚀 Запуск парсера...")
-    successful = 0
-    for i, group in enumerate(groups, 1):
-        success = parser.parse_semester(group_id=group['id'], group_name=group['name'], start_week=1, end_week=18)
-        if success:
-            successful += 1
+    ap = argparse.ArgumentParser(description='Парсер расписания ИСУ УУНиТ')
+    ap.add_argument('--groups', default='groups.json')
+    ap.add_argument('--db', default='db/university.db')
+    ap.add_argument('--url', default=ISU_URL, help='адрес скрипта расписания ИСУ')
+    ap.add_argument('--start-week', type=int, default=1)
+    ap.add_argument('--end-week', type=int, default=18)
+    ap.add_argument('--workers', type=int, default=4, help='число параллельных запросов')
+    ap.add_argument('--rate', type=float, default=5.0, help='макс. запросов в секунду к хосту (0 — без ограничения)')
+    ap.add_argument('--retries', type=int, default=3)
+    ap.add_argument('--backoff', type=float, default=0.5, help='базовая задержка перед повтором, с')
+    ap.add_argument('--force', action='store_true', help='перезаписать недели, даже если они не изменились')
+    ap.add_argument('--record', metavar='DIR', help='сохранять сырые ответы ИСУ в архив')
+    ap.add_argument('--replay', metavar='DIR', help='разобрать ответы из архива вместо обращения к ИСУ')
+    ap.add_argument('--processes', type=int, default=None, help='число процессов разбора при --replay')
+    queue = ap.add_argument_group('очередь задач')
+    queue.add_argument('--enqueue', action='store_true', help='поставить недели групп в очередь')
+    queue.add_argument('--fresh-hours', type=float, default=6, help='не ставить повторно недели, обновлённые за это время')
+    queue.add_argument('--work', action='store_true', help='разбирать очередь (можно запускать несколько воркеров)')
+    queue.add_argument('--batch', type=int, default=18, help='сколько задач брать за раз')
+    queue.add_argument('--lease', type=int, default=300, help='время аренды задачи, с')
+    queue.add_argument('--max-attempts', type=int, default=5, help='после стольких неудачных обходов задача помечается failed')
+    queue.add_argument('--shard', default='0/1', help='брать только группы с group_id %% N == I (формат I/N)')
+    queue.add_argument('--status', action='store_true', help='показать состояние очереди')
+    args = ap.parse_args()
+
+    db_session.global_init(args.db)
+    if args.status:
+        crawl_queue.print_status()
+        return
+    parser = ScheduleParser(base_url=args.url, workers=args.workers, rate_limit=args.rate, retries=args.retries, backoff=args.backoff, force=args.force, archive_dir=args.replay or args.record)
+    groups = load_groups(args.groups)
+    print("🚀 Запуск парсера..." if not args.replay else f"🚀 Разбор архива {args.replay}...")
+    started = time.monotonic()
+    try:
+        if args.replay:
+            report = parser.replay(groups, args.start_week, args.end_week, processes=args.processes)
+        elif args.enqueue or args.work:
+            report = []
+            if args.enqueue:
+                requeued = crawl_queue.enqueue(groups, args.start_week, args.end_week, args.fresh_hours)
+                print(f"📥 В очередь поставлены недели {len(groups)} групп (повторно: {requeued})")
+            if args.work:
+                shard, shards = (int(x) for x in args.shard.split('/'))
+                report = crawl_queue.work(parser, batch=args.batch, lease_seconds=args.lease, shard=shard, shards=shards, max_attempts=args.max_attempts)
+        else:
+            report = parser.crawl(groups, args.start_week, args.end_week)
+    finally:
+        parser.close()
+    for group_name, g in summarize_report(report).items():
+        mark = '✅' if g['ok'] and not g['failed'] and not g['save_failed'] else '⚠️'
+        print(f"{mark} {group_name}: недель ок {g['ok']} (новых {g['new']}, обновлено {g['updated']}, без изменений {g['unchanged']}), пустых {g['empty']}, ошибок {g['failed'] + g['save_failed']}, пар {g['lessons']}")
+        for error in g['errors']:
+            print(f"    ❌ {error}")
+    totals = {key: sum(r['write'] == key for r in report) for key in ('new', 'updated', 'unchanged')}
+    print(f"📊 Всего недель: новых {totals['new']}, обновлено {totals['updated']}, без изменений {totals['unchanged']}")
+    print(f"⏱ {len(report)} недель за {time.monotonic() - started:.1f} с")
+    if args.enqueue or args.work:
+        crawl_queue.print_status()
+    db_session.shutdown()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import random
+import threading
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+
+from data import db_session
+from data.schedule import current_week
+from data.week_fingerprints import WeekFingerprint
+from parser import ScheduleParser, load_groups
+
+# Фоновое обновление расписания с приоритетами: текущая и следующая недели — часто,
+# будущие — реже, прошедшие — совсем редко. Старт и интервалы каждой группы сдвинуты
+# случайным образом, чтобы группы не обращались к ИСУ одновременно
+
+WEEKS = 18
+TIERS = {
+    'hot': {'minutes': 30, 'jitter': 5 * 60},        # текущая и следующая неделя
+    'future': {'minutes': 6 * 60, 'jitter': 30 * 60},  # недели после следующей
+    'past': {'minutes': 48 * 60, 'jitter': 2 * 3600},  # прошедшие недели
+}
+
+_scheduler = None
+_parser = None
+_lock = threading.Lock()
+
+
+def tier_weeks(tier, week):
+    if tier == 'hot':
+        return [w for w in (week, week + 1) if w <= WEEKS]
+    if tier == 'future':
+        return list(range(week + 2, WEEKS + 1))
+    return list(range(1, week))
+
+
+def refresh(group, tier):
+    s = db_session.create_read_session()
+    try:
+        week = current_week(s, weeks=WEEKS) or 1
+    finally:
+        s.close()
+    weeks = tier_weeks(tier, week)
+    if not weeks:
+        return []
+    # Задачи выполняются по одной (один поток планировщика), поэтому в SQLite пишет один писатель
+    with _lock:
+        return _parser.crawl_tasks([(group['id'], group['name'], w) for w in weeks])
+
+
+def add_jobs(scheduler, groups, tiers=TIERS):
+    now = datetime.now()
+    for group in groups:
+        for tier, cfg in tiers.items():
+            # Первый запуск — в случайный момент внутри интервала (горячие недели — в первые минуты)
+            spread = min(cfg['minutes'] * 60, 10 * 60) if tier == 'hot' else cfg['minutes'] * 60
+            scheduler.add_job(refresh, IntervalTrigger(minutes=cfg['minutes'], jitter=cfg['jitter'], start_date=now + timedelta(seconds=random.uniform(0, spread))),
+                              args=[group, tier], id=f"{tier}:{group['id']}", name=f"{group['name']} ({tier})", replace_existing=True, coalesce=True, max_instances=1)
+
+
+def make_scheduler(blocking=False, workers=4, rate_limit=2.0):
+    global _parser
+    _parser = ScheduleParser(workers=workers, rate_limit=rate_limit)
+    executors = {'default': {'type': 'threadpool', 'max_workers': 1}}
+    cls = BlockingScheduler if blocking else BackgroundScheduler
+    return cls(executors=executors, job_defaults={'misfire_grace_time': 15 * 60})
+
+
+def start(groups_file='groups.json'):
+    # Запуск внутри веб-приложения; вызывать в одном процессе (см. REFRESH_SCHEDULER в app.py)
+    global _scheduler
+    if _scheduler:
+        return _scheduler
+    _scheduler = make_scheduler()
+    add_jobs(_scheduler, load_groups(groups_file))
+    _scheduler.start()
+    return _scheduler
+
+
+def status(groups_file='groups.json'):
+    # Время последней проверки и отставание по каждой группе — из week_fingerprints,
+    # поэтому работает и когда планировщик запущен отдельным процессом
+    now = datetime.now()
+    groups = load_groups(groups_file)
+    fp = WeekFingerprint.__table__
+    s = db_session.create_read_session()
+    try:
+        week = current_week(s, weeks=WEEKS)
+        rows = s.execute(sa.select(fp.c.group_id, fp.c.week_number, fp.c.checked_at, fp.c.changed_at)
+                         .where(fp.c.group_id.in_([group['id'] for group in groups]))).all()
+    finally:
+        s.close()
+    by_group = {}
+    for group_id, week_number, checked_at, changed_at in rows:
+        by_group.setdefault(group_id, {})[week_number] = (checked_at, changed_at)
+    result = {'текущая_неделя': week, 'планировщик_запущен': bool(_scheduler and _scheduler.running), 'группы': []}
+    for group in groups:
+        weeks = by_group.get(group['id'], {})
+        entry = {'группа': group['name'], 'group_id': group['id'], 'последнее_обновление': None, 'последнее_изменение': None, 'отставание_сек': {}}
+        if weeks:
+            entry['последнее_обновление'] = max(checked for checked, _ in weeks.values()).strftime('%Y-%m-%d %H:%M:%S')
+            entry['последнее_изменение'] = max(changed for _, changed in weeks.values()).strftime('%Y-%m-%d %H:%M:%S')
+        for tier in TIERS:
+            tier_checked = [weeks[w][0] if w in weeks else None for w in tier_weeks(tier, week or 1)]
+            if tier_checked:
+                oldest = None if None in tier_checked else min(tier_checked)
+                entry['отставание_сек'][tier] = int((now - oldest).total_seconds()) if oldest else None
+        if _scheduler:
+            entry['следующий_запуск'] = {}
+            for tier in TIERS:
+                job = _scheduler.get_job(f"{tier}:{group['id']}")
+                entry['следующий_запуск'][tier] = job.next_run_time.strftime('%Y-%m-%d %H:%M:%S') if job and job.next_run_time else None
+        result['группы'].append(entry)
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Фоновое обновление расписания')
+    ap.add_argument('--groups', default='groups.json')
+    ap.add_argument('--db', default='db/university.db')
+    ap.add_argument('--workers', type=int, default=4)
+    ap.add_argument('--rate', type=float, default=2.0, help='макс. запросов в секунду к ИСУ')
+    args = ap.parse_args()
+    db_session.global_init(args.db)
+    scheduler = make_scheduler(blocking=True, workers=args.workers, rate_limit=args.rate)
+    groups = load_groups(args.groups)
+    add_jobs(scheduler, groups)
+    print(f"🕒 Планировщик: {len(groups)} групп, интервалы " + ', '.join(f"{tier} {cfg['minutes']} мин" for tier, cfg in TIERS.items()))
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Кэш готового расписания группы в памяти процесса. Запись действительна, пока версия группы
+# в БД (study_groups.version, её увеличивает парсер) совпадает с версией при заполнении,
+# поэтому кэши разных процессов веб-приложения не расходятся с данными
+
+
+class ScheduleCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # ключ -> (версия, данные, JSON, ETag)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, key, version, data, payload, etag=None):
+        # ETag по умолчанию — хэш содержимого; можно передать свой, если он известен до сборки ответа
+        etag = etag or hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        with self.lock:
+            self.entries[key] = (version, data, payload, etag)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return data, payload, etag
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,60 @@
+// Загрузка материала частями (/api/uploads): после обрыва связи отправка продолжается с последней принятой части,
+// а не с начала файла. Форма помечается data-chunked-upload, data-error-url — куда вернуться с ошибкой
+(function () {
+    const RETRIES = 6;
+
+    async function request(url, options) {
+        const response = await fetch(url, options);
+        const body = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw Object.assign(new Error(body.error || response.statusText), {status: response.status});
+        }
+        return body;
+    }
+
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    async function upload(form, file, progress) {
+        let state = await request('/api/uploads', {
+            method: 'POST', headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size})
+        });
+        const id = state.id;
+        let failures = 0;
+        while (!state.complete) {
+            const start = state.next_chunk * state.chunk_size;
+            try {
+                state = await request(`/api/uploads/${id}/chunks/${state.next_chunk}`, {
+                    method: 'PUT', headers: {'Content-Type': 'application/octet-stream'},
+                    body: file.slice(start, start + state.chunk_size)
+                });
+                failures = 0;
+            } catch (e) {
+                // Ответ сервера с ошибкой (4xx) не повторяем; обрыв сети — ждём и спрашиваем, что уже принято
+                if ((e.status && e.status < 500) || ++failures > RETRIES) throw e;
+                await sleep(1000 * 2 ** failures);
+                state = await request(`/api/uploads/${id}`).catch(() => state);
+            }
+            progress(state.received / state.size);
+        }
+        const data = new FormData(form);
+        data.delete('file');
+        return request(`/api/uploads/${id}/complete`, {method: 'POST', body: data});
+    }
+
+    document.querySelectorAll('form[data-chunked-upload]').forEach(form => form.addEventListener('submit', async event => {
+        const input = form.querySelector('input[type="file"]');
+        if (!window.fetch || !input.files.length) return;
+        event.preventDefault();
+        const button = form.querySelector('[type="submit"]');
+        button.disabled = true;
+        try {
+            const result = await upload(form, input.files[0], share => {
+                button.textContent = `Загрузка… ${Math.round(share * 100)}%`;
+            });
+            window.location = result.redirect;
+        } catch (e) {
+            window.location = form.dataset.errorUrl + '?error=' + encodeURIComponent('Ошибка загрузки: ' + e.message);
+        }
+    }));
+})();
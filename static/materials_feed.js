@@ -0,0 +1,59 @@
+// Лента материалов: первая страница приходит в HTML, следующие — из /api/materials при прокрутке по курсору data-next.
+// Контейнер: data-materials-feed="<постоянные параметры запроса>", data-template — id <template> карточки
+// (поля — data-field с ключами API, __id__ в href/action, data-role — элементы только для teacher / student)
+(function () {
+    const feed = document.querySelector('[data-materials-feed]');
+    if (!feed) return;
+    const template = document.getElementById(feed.dataset.template);
+    const empty = feed.querySelector('[data-feed-empty]');
+    const sentinel = document.createElement('div');
+    feed.after(sentinel);
+    const filters = {};
+    let generation = 0, loading = false;
+
+    function card(m) {
+        const node = template.content.firstElementChild.cloneNode(true);
+        node.querySelectorAll('[data-field]').forEach(el => { el.textContent = m[el.dataset.field] ?? ''; });
+        node.querySelectorAll('[data-optional]').forEach(el => { if (!el.textContent.trim()) el.remove(); });
+        node.querySelectorAll('[data-role]').forEach(el => { if (el.dataset.role !== m['роль']) el.remove(); });
+        for (const attr of ['href', 'action']) {
+            node.querySelectorAll(`[${attr}]`).forEach(el => el.setAttribute(attr, el.getAttribute(attr).replace('__id__', m.id)));
+        }
+        if (node.dataset.teacherClass) node.classList.toggle(node.dataset.teacherClass, m['роль'] === 'teacher');
+        node.dataset.subject = m['предмет'];
+        node.dataset.type = m['тип'];
+        return node;
+    }
+
+    function nearBottom() {
+        return sentinel.getBoundingClientRect().top < window.innerHeight + 400;
+    }
+
+    async function load(reset) {
+        if (!reset && (loading || !feed.dataset.next)) return;
+        const current = ++generation;
+        loading = true;
+        const params = new URLSearchParams(feed.dataset.materialsFeed);
+        Object.entries(filters).forEach(([name, value]) => { if (value) params.set(name, value); });
+        if (!reset) params.set('after', feed.dataset.next);
+        try {
+            const page = await (await fetch('/api/materials?' + params)).json();
+            if (current !== generation) return;  // фильтр сменился, пока шёл запрос
+            if (reset) feed.querySelectorAll('[data-material]').forEach(el => el.remove());
+            page['материалы'].forEach(m => feed.insertBefore(card(m), empty));
+            feed.dataset.next = page['следующая'] || '';
+            if (empty) empty.style.display = feed.querySelector('[data-material]') ? 'none' : '';
+        } finally {
+            if (current === generation) loading = false;
+        }
+        if (nearBottom()) load(false);
+    }
+
+    new IntersectionObserver(entries => { if (entries[0].isIntersecting) load(false); }, {rootMargin: '400px'}).observe(sentinel);
+    window.materialsFeed = {
+        filter(name, value) {
+            filters[name] = value;
+            load(true);
+        }
+    };
+})();
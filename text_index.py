@@ -0,0 +1,264 @@
+import argparse
+import logging
+import os
+import queue
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+import sqlalchemy as sa
+
+from data import db_session
+from data.blobs import Blob, adopt_files, blob_key, material_file
+
+# Текст загруженных файлов для поиска (file_text_fts): pdf — через pypdf, docx и pptx — это zip с XML,
+# их разбирает стандартная библиотека. Текст извлекается один раз на содержимое (blobs.sha256) в отдельном процессе,
+# запрос загрузки только ставит задачу. Очередь — blobs.text_status: NULL ждёт, queued взят процессом веб-приложения
+# в text_claimed_at. Процесс разбирает свои задачи по одной и после каждого файла продлевает взятие остальных;
+# задача, не продлённая дольше CLAIM_TIMEOUT (процесс упал или перезапущен), считается брошенной:
+# её заново берут start(), следующая загрузка или python text_index.py
+
+MAX_TEXT = 1_000_000  # символов на файл
+JOB_TIMEOUT = 120  # с на файл: зависший разбор не задерживает остальные
+CLAIM_TIMEOUT = timedelta(minutes=15)  # заметно больше JOB_TIMEOUT
+WORD = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DRAWING = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+SLIDE = re.compile(r'ppt/slides/slide(\d+)\.xml')
+
+blobs = Blob.__table__
+_root = None
+_queue = queue.Queue()
+_inflight = set()  # sha256, взятые этим процессом и ещё не сохранённые
+_worker = None
+_lock = threading.Lock()
+
+
+def xml_text(archive, parts, ns):
+    # Абзацы (w:p / a:p) — строками, текстовые фрагменты внутри абзаца склеиваются
+    lines = []
+    for part in parts:
+        root = ElementTree.parse(archive.open(part)).getroot()
+        lines.extend(''.join(t.text or '' for t in p.iter(f'{ns}t')) for p in root.iter(f'{ns}p'))
+    return '\n'.join(line for line in lines if line.strip())
+
+
+def pdf_text(path):
+    from pypdf import PdfReader
+    logging.getLogger('pypdf').setLevel(logging.ERROR)  # предупреждения о кривой разметке PDF текст не портят
+    return '\n'.join(page.extract_text() or '' for page in PdfReader(path).pages)
+
+
+def extract_text(path):
+    # Формат определяется по содержимому, а не по имени: у одного файла в хранилище может быть несколько имён.
+    # None — формат не поддерживается (doc, ppt)
+    with open(path, 'rb') as f:
+        head = f.read(5)
+    if head.startswith(b'%PDF'):
+        return pdf_text(path)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            if 'word/document.xml' in names:
+                return xml_text(archive, ['word/document.xml'], WORD)
+            slides = sorted((int(m.group(1)), name) for name in names if (m := SLIDE.fullmatch(name)))
+            if slides:
+                return xml_text(archive, [name for _, name in slides], DRAWING)
+    return None
+
+
+def extract_job(path):
+    # Выполняется в дочернем процессе: возвращает (статус, текст), исключения не пробрасывает
+    try:
+        text = extract_text(path)
+    except Exception as e:
+        return 'failed', f'{type(e).__name__}: {e}'
+    if text is None:
+        return 'unsupported', None
+    text = text.strip()[:MAX_TEXT]
+    return ('done', text) if text else ('empty', None)
+
+
+def save_text(s, sha256, status, text):
+    # Статус и текст пишутся вместе; если файл успели удалить (collect_garbage), строки blobs нет — ничего не пишем
+    if s.execute(blobs.update().where(blobs.c.sha256 == sha256).values(text_status=status, text_extracted_at=datetime.now())).rowcount:
+        s.execute(sa.text('DELETE FROM file_text_fts WHERE sha256 = :sha256'), {'sha256': sha256})
+        if status == 'done':
+            s.execute(sa.text('INSERT INTO file_text_fts (body, sha256) VALUES (:body, :sha256)'), {'body': text.replace('ё', 'е').replace('Ё', 'Е'), 'sha256': sha256})
+    s.commit()
+
+
+class Extractor:
+    # Один рабочий процесс и ограничение времени на файл. Процесс, который завис или упал (segfault, OOM в разборе),
+    # завершается и заменяется новым, а файл получает статус failed
+    def __init__(self):
+        self.pool = None
+
+    def run(self, path):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=1)
+        try:
+            future = self.pool.submit(extract_job, path)
+        except BrokenProcessPool:
+            self.reset()  # процесс умер, пока пул простаивал
+            self.pool = ProcessPoolExecutor(max_workers=1)
+            future = self.pool.submit(extract_job, path)
+        try:
+            return future.result(timeout=JOB_TIMEOUT)
+        except TimeoutError:
+            self.reset()
+            return 'failed', f'разбор дольше {JOB_TIMEOUT} с'
+        except BrokenProcessPool as e:
+            self.reset()
+            return 'failed', f'рабочий процесс завершился аварийно: {e}'
+
+    def reset(self):
+        # У ProcessPoolExecutor нет снятия зависшей задачи — процесс завершается напрямую
+        for process in list((self.pool._processes or {}).values()):
+            process.terminate()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = None
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def _finish(sha256, status, text):
+    # Сохраняет результат и продлевает взятие остальных задач процесса, чтобы их не перехватили как брошенные
+    with _lock:
+        _inflight.discard(sha256)
+        waiting = list(_inflight)
+    s = db_session.create_session()
+    try:
+        try:
+            save_text(s, sha256, status, text)
+        except Exception as e:
+            print(f'❌ Текст файла {sha256[:12]} не сохранён: {e}')
+            s.rollback()
+            s.execute(blobs.update().where(blobs.c.sha256 == sha256, blobs.c.text_status == 'queued').values(text_status=None, text_claimed_at=None))
+            s.commit()
+        if waiting:
+            s.execute(blobs.update().where(blobs.c.sha256.in_(waiting), blobs.c.text_status == 'queued').values(text_claimed_at=datetime.now()))
+            s.commit()
+    finally:
+        s.close()
+
+
+def _work():
+    # Поток процесса веб-приложения: задачи из очереди по одной
+    extractor = Extractor()
+    while True:
+        sha256 = _queue.get()
+        try:
+            status, text = extractor.run(material_file(_root, blob_key(sha256)))
+            if status == 'failed':
+                print(f'❌ Текст файла {sha256[:12]} не извлечён: {text}')
+            _finish(sha256, status, text)
+        except Exception as e:
+            print(f'❌ Текст файла {sha256[:12]}: {e}')
+
+
+def stale_claim(skip=()):
+    # Задачи, взятые в queued и брошенные: процесс, который их взял, не продлевал взятие дольше CLAIM_TIMEOUT.
+    # skip — свои задачи, ещё ждущие в очереди этого процесса
+    stale = sa.and_(blobs.c.text_status == 'queued', sa.or_(blobs.c.text_claimed_at.is_(None), blobs.c.text_claimed_at < datetime.now() - CLAIM_TIMEOUT))
+    return sa.and_(stale, blobs.c.sha256.not_in(list(skip))) if skip else stale
+
+
+def _claim(s, sha256=None, skip=()):
+    # Помечает задачи взятыми одним UPDATE ... RETURNING — несколько процессов приложения не берут одно и то же.
+    # Вместе с новым файлом забираются и брошенные задачи
+    waiting = blobs.c.text_status.is_(None)
+    if sha256:
+        waiting = sa.and_(waiting, blobs.c.sha256 == sha256)
+    q = blobs.update().where(sa.or_(waiting, stale_claim(skip)))
+    claimed = s.execute(q.values(text_status='queued', text_claimed_at=datetime.now()).returning(blobs.c.sha256)).scalars().all()
+    s.commit()
+    return claimed
+
+
+def submit(sha256=None):
+    # Ставит извлечение в очередь и сразу возвращается; без sha256 — всё, что ждёт в БД.
+    # Ошибки не пробрасываются: загрузка уже сохранена, а невзятый файл подхватит следующий запуск
+    global _worker
+    try:
+        with _lock:
+            busy = set(_inflight)
+        s = db_session.create_session()
+        try:
+            claimed = _claim(s, sha256, busy)
+        finally:
+            s.close()
+        with _lock:
+            _inflight.update(claimed)
+            if claimed and _worker is None:
+                _worker = threading.Thread(target=_work, daemon=True)
+                _worker.start()
+        for key in claimed:
+            _queue.put(key)
+        return len(claimed)
+    except Exception as e:
+        print(f'❌ Извлечение текста не запущено: {e}')
+        return 0
+
+
+def start(root):
+    # При запуске приложения: папка загрузок и то, что осталось в очереди с прошлого раза
+    global _root
+    _root = root
+    return submit()
+
+
+def backfill(root, retry=False, workers=None):
+    # Переносит старые загрузки в хранилище и извлекает текст всех файлов без него.
+    # retry — повторить и неудачные, неподдерживаемые и все queued, в том числе взятые работающим приложением
+    s = db_session.create_session()
+    try:
+        adopt_files(s, root)
+        pending = sa.or_(blobs.c.text_status.is_(None), stale_claim())
+        if retry:
+            pending = sa.or_(pending, blobs.c.text_status.in_(['queued', 'failed', 'unsupported']))
+        keys = s.execute(sa.select(blobs.c.sha256).where(pending).order_by(blobs.c.sha256)).scalars().all()
+        counts, extractors = {}, queue.Queue()
+        for _ in range(workers or os.cpu_count() or 1):
+            extractors.put(Extractor())
+
+        def run(key):
+            extractor = extractors.get()
+            try:
+                return extractor.run(material_file(root, blob_key(key)))
+            finally:
+                extractors.put(extractor)
+        with ThreadPoolExecutor(max_workers=extractors.qsize()) as threads:
+            for key, (status, text) in zip(keys, threads.map(run, keys)):
+                save_text(s, key, status, text)
+                counts[status] = counts.get(status, 0) + 1
+                if status == 'failed':
+                    print(f'❌ {key[:12]}: {text}')
+        while not extractors.empty():
+            extractors.get().close()
+        return counts
+    finally:
+        s.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Извлечение текста загруженных файлов для поиска')
+    ap.add_argument('--db', default='db/university.db')
+    ap.add_argument('--uploads', default='uploads')
+    ap.add_argument('--retry', action='store_true', help='повторить неудачные и неподдерживаемые')
+    ap.add_argument('--workers', type=int, default=None)
+    args = ap.parse_args()
+    db_session.global_init(args.db, checkpoint_interval=0)
+    counts = backfill(args.uploads, args.retry, args.workers)
+    details = ', '.join(f'{status}: {n}' for status, n in sorted(counts.items()))
+    print(f'✅ Файлов обработано: {sum(counts.values())}' + (f' ({details})' if details else ''))
+
+
+if __name__ == '__main__':
+    main()
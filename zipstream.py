@@ -0,0 +1,46 @@
+import os
+import zipfile
+
+# ZIP «на лету»: архив пишется в генератор кусками, без временного файла и без архива целиком в памяти.
+# Выход не поддерживает seek, поэтому zipfile пишет размеры и CRC после данных (data descriptor).
+# Уже сжатые форматы (pdf, а docx и pptx — сами zip) кладутся без сжатия, остальное — deflate
+
+CHUNK = 256 * 1024  # байт; больше этого в памяти не копится
+STORED_EXTENSIONS = {'pdf', 'docx', 'pptx', 'zip', 'jpg', 'jpeg', 'png'}
+
+
+class _Sink:
+    # Файлоподобный приёмник для zipfile: только write/flush, накопленное забирает drain()
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def zip_chunks(entries):
+    # entries — [(имя в архиве, путь к файлу, datetime)]; отдаёт байты архива кусками по мере чтения файлов
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for name, path, modified in entries:
+            info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+            stored = name.rsplit('.', 1)[-1].lower() in STORED_EXTENSIONS
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            info.file_size = os.path.getsize(path)  # по нему zipfile решает, нужен ли ZIP64
+            with open(path, 'rb') as src, archive.open(info, 'w') as dst:
+                for block in iter(lambda: src.read(CHUNK), b''):
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    # Центральный каталог пишется при закрытии архива
+    yield sink.drain()